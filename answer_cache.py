@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# ذاكرة إجابات دلالية لـ /ask و answer_question: المفتاح متجه السؤال، فالسؤال المكرر
+# أو المُعاد صياغته يُجاب من القاعدة في أجزاء من الثانية دون بناء سياق أو استدعاء LLM.
+# - عتبة تشابه، TTL، وإخلاء LRU عند تجاوز الحجم.
+# - كلمات كل سؤال المميِّزة مفهرسة، فوصول مستند جديد عن الموضوع يُسقط إجاباته القديمة.
+import os, re, json, time, threading, numpy as np
+from typing import Dict, List, Optional, Tuple
+import db, fts, tfidf
+from embedder import get_embedder
+
+THRESHOLD = float(os.getenv("AUTOLEARN_CACHE_THRESHOLD", "0.92"))
+TTL_SEC = int(os.getenv("AUTOLEARN_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("AUTOLEARN_CACHE_MAX", "2000"))
+# كلمة تظهر في أكثر من هذه النسبة من مستندات المدونة (tfidf_df) لا تميّز موضوعًا
+COMMON_DF = float(os.getenv("AUTOLEARN_CACHE_COMMON_DF", "0.05"))
+MIN_DOCS = 50  # مدونة أصغر: نسب df غير موثوقة، نكتفي بالكلمات الوظيفية
+
+DDL = (
+    """CREATE TABLE IF NOT EXISTS answer_cache(
+        id INTEGER PRIMARY KEY, scope TEXT, question TEXT, emb BLOB, answer TEXT,
+        n_terms INTEGER, created_at REAL, last_hit REAL, hits INTEGER DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS answer_cache_terms(
+        term TEXT, entry_id INTEGER, PRIMARY KEY(term, entry_id)) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS answer_cache_stats(k TEXT PRIMARY KEY, v INTEGER)""",
+)
+
+def ensure(con):
+    for q in DDL: con.execute(q)
+    con.commit()
+
+def _stem(w: str) -> str:
+    return w[2:] if w.startswith("ال") and len(w) > 4 else w
+
+# كلمات وظيفية (بعد التطبيع) لا تدل على موضوع: اشتراكها وحده لا يُسقط إجابة
+STOP = {_stem(w) for w in fts.normalize(
+    "the and for with that this from are was were has have had not but you your our their its his her "
+    "they them what which who whom when where why how can could will would should about into over after "
+    "before than then there here all any more most some such only also just been being does did out "
+    "new one two said says year years "
+    "التي الذي الذين اللذين هذا هذه ذلك تلك هؤلاء على إلى الى عن في من مع بين بعد قبل عند حتى منذ "
+    "كان كانت يكون تكون ليس لكن أو ثم كما لما لقد قد إن أن إنه أنه هو هي هم هن نحن أنت كل بعض غير "
+    "ما ماذا لماذا كيف متى أين هل لا لم لن التى وقال قال قالت عام خلال حول أيضا").split()}
+
+def terms(text: str) -> List[str]:
+    out = []
+    for w in re.findall(r"\w+", fts.normalize((text or "").lower())):
+        w = _stem(w)
+        if len(w) >= 3 and w not in STOP: out.append(w)
+    return list(dict.fromkeys(out))
+
+def informative(con, ts: List[str]) -> List[str]:
+    """أسقط الكلمات الشائعة في المدونة (df/n_docs > COMMON_DF)، بصيغتيها مع "ال" وبدونها."""
+    n = tfidf.n_docs(con)
+    if n < MIN_DOCS or not ts: return ts
+    forms = ts + ["ال" + t for t in ts]
+    try:
+        df = dict(con.execute(f"SELECT term, df FROM tfidf_df WHERE term IN ({','.join('?' * len(forms))})",
+                              forms).fetchall())
+    except Exception:
+        return ts
+    return [t for t in ts if df.get(t, 0) + df.get("ال" + t, 0) <= COMMON_DF * n]
+
+def _bump(cur, k: str, n: int = 1):
+    cur.execute("INSERT INTO answer_cache_stats(k, v) VALUES(?, ?) ON CONFLICT(k) DO UPDATE SET v = v + ?",
+                (k, n, n))
+
+def _delete(cur, ids: List[int]):
+    if not ids: return
+    marks = ",".join("?" * len(ids))
+    cur.execute(f"DELETE FROM answer_cache WHERE id IN ({marks})", ids)
+    cur.execute(f"DELETE FROM answer_cache_terms WHERE entry_id IN ({marks})", ids)
+    _bump(cur, "generation")
+
+def invalidate_topic(cur, text: str) -> int:
+    """أسقط الإجابات التي تشترك كلماتها المميِّزة (اثنتان على الأقل) مع نص مستند جديد."""
+    return invalidate_terms(cur, informative(cur, terms(text)))
+
+def invalidate_terms(cur, ts: List[str]) -> int:
+    """كـ invalidate_topic بكلمات محسوبة مسبقًا (شظية تحسبها بإحصاءاتها، والذاكرة في القاعدة الأساسية)."""
+    if not ts: return 0
+    marks = ",".join("?" * len(ts))
+    try:
+        ids = [r[0] for r in cur.execute(
+            f"SELECT t.entry_id FROM answer_cache_terms t JOIN answer_cache c ON c.id = t.entry_id "
+            f"WHERE t.term IN ({marks}) GROUP BY t.entry_id HAVING COUNT(*) >= MIN(2, MAX(c.n_terms, 1))", ts)]
+    except Exception:
+        return 0  # الجداول غير موجودة بعد
+    _delete(cur, ids)
+    return len(ids)
+
+def stats(con) -> Dict:
+    try:
+        kv = dict(con.execute("SELECT k, v FROM answer_cache_stats").fetchall())
+        entries = con.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+    except Exception:
+        kv, entries = {}, 0
+    hits, misses = kv.get("hits", 0), kv.get("misses", 0)
+    return {"entries": entries, "hits": hits, "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0}
+
+class AnswerCache:
+    def __init__(self, db_path: str, scope: str, threshold: float = THRESHOLD,
+                 ttl_sec: int = TTL_SEC, max_entries: int = MAX_ENTRIES):
+        self.db_path, self.scope = db_path, scope
+        self.threshold, self.ttl, self.max_entries = threshold, ttl_sec, max_entries
+        self._lock = threading.Lock()
+        self._gen = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._mat = np.zeros((0, 384), dtype=np.float32)
+        ensure(db.connect(db_path))
+
+    def _reload(self, con):
+        # نعيد تحميل المصفوفة فقط إذا تغيّر عدّاد الجيل (إضافة/حذف من أي عملية)
+        row = con.execute("SELECT v FROM answer_cache_stats WHERE k='generation'").fetchone()
+        gen = row[0] if row else 0
+        if gen == self._gen: return
+        rows = con.execute("SELECT id, emb FROM answer_cache WHERE scope=?", (self.scope,)).fetchall()
+        self._ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self._mat = (np.frombuffer(b"".join(r[1] for r in rows), dtype=np.float32).reshape(-1, 384)
+                     if rows else np.zeros((0, 384), dtype=np.float32))
+        self._gen = gen
+
+    def get(self, question: str) -> Tuple[Optional[Dict], np.ndarray]:
+        """(الإجابة المخزنة أو None، متجه السؤال لإعادة استخدامه في put)."""
+        qv = get_embedder().encode(question)[0]
+        con = db.connect(self.db_path)
+        with self._lock:
+            self._reload(con)
+            best = None
+            if len(self._ids):
+                S = self._mat @ qv
+                i = int(np.argmax(S))
+                if S[i] >= self.threshold: best = int(self._ids[i])
+        now = time.time()
+        with con:
+            cur = con.cursor()
+            row = best and cur.execute("SELECT answer, created_at FROM answer_cache WHERE id=?", (best,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                cur.execute("UPDATE answer_cache SET last_hit=?, hits=hits+1 WHERE id=?", (now, best))
+                _bump(cur, "hits")
+                return json.loads(row[0]), qv
+            if row: _delete(cur, [best])  # منتهي الصلاحية
+            _bump(cur, "misses")
+        return None, qv
+
+    def put(self, question: str, qv: np.ndarray, answer: Dict):
+        now = time.time()
+        con = db.connect(self.db_path)
+        ts = informative(con, terms(question))
+        with con:
+            cur = con.cursor()
+            cur.execute("INSERT INTO answer_cache(scope, question, emb, answer, n_terms, created_at, last_hit) "
+                        "VALUES(?,?,?,?,?,?,?)",
+                        (self.scope, question, np.asarray(qv, dtype=np.float32).tobytes(),
+                         json.dumps(answer, ensure_ascii=False), len(ts), now, now))
+            eid = cur.lastrowid
+            cur.executemany("INSERT OR IGNORE INTO answer_cache_terms(term, entry_id) VALUES(?,?)",
+                            [(t, eid) for t in ts])
+            _bump(cur, "generation")
+            # إخلاء: المنتهي أولًا ثم الأقل استخدامًا مؤخرًا
+            stale = [r[0] for r in cur.execute("SELECT id FROM answer_cache WHERE created_at < ?",
+                                               (now - self.ttl,))]
+            extra = cur.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0] - len(stale) - self.max_entries
+            if extra > 0:
+                stale += [r[0] for r in cur.execute(
+                    "SELECT id FROM answer_cache WHERE created_at >= ? ORDER BY last_hit LIMIT ?",
+                    (now - self.ttl, extra))]
+            _delete(cur, stale)
@@ -1,7 +1,8 @@
 # autolearn.py
-import os, time, yaml, subprocess, sys
+import os, time, yaml, subprocess, sys, signal, argparse, threading
 
 CONFIG_PATH = os.path.join(os.getcwd(), "config.yaml")
+TICK_SEC = 5
 
 def load_cfg():
     with open(CONFIG_PATH, "r", encoding="utf-8") as f:
@@ -12,7 +13,68 @@ def run_once():
     cmd = [sys.executable, "news_worker.py", "--once"]
     subprocess.run(cmd, check=False)
 
-def main():
+class ConfigWatcher:
+    """يعيد قراءة config.yaml فقط عند تغيّر mtime، ويحتفظ بآخر إعدادات صالحة."""
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self.mtime = None
+        self.cfg = {}
+
+    def get(self):
+        try:
+            m = os.path.getmtime(self.path)
+            if m != self.mtime:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.cfg = yaml.safe_load(f) or {}
+                if self.mtime is not None:
+                    print("🔄 config.yaml changed — reloaded")
+                self.mtime = m
+        except Exception as e:
+            print("⚠️ Failed to read config.yaml, keeping previous settings:", e)
+        return self.cfg
+
+def schedule_minutes(cfg, source):
+    pace = cfg.get("pace", {}) or {}
+    default = int(pace.get("interval_minutes", 10))
+    return int((pace.get("schedules", {}) or {}).get(source, default))
+
+def run_daemon():
+    # عملية مقيمة: الوحدات والنموذج والاتصالات وحالة الجلب تبقى دافئة بين الدورات
+    import news_worker, retention
+    from autolearn.learn_loop import STOP_FLAG, should_stop
+
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+
+    watcher = ConfigWatcher()
+    maint = retention.Maintainer(news_worker.DB_PATH)
+    last_run = {s: 0.0 for s in news_worker.SOURCES}
+    print("🔁 AutoLearn daemon starting (create STOP file to exit)...")
+    while not stop.is_set() and not should_stop():
+        cfg = watcher.get()
+        now = time.time()
+        due = [s for s in news_worker.SOURCES if now - last_run[s] >= schedule_minutes(cfg, s) * 60]
+        if due:
+            try:
+                news_worker.run_cycle(cfg=cfg, sources=due)
+            except Exception as e:
+                print("⚠️ cycle failed:", e)
+            for s in due:
+                last_run[s] = time.time()
+        else:
+            # لا دورة مستحقة: خطوة صيانة صغيرة (تبريد/حذف دفعة، incremental_vacuum)
+            try:
+                maint.step(cfg)
+            except Exception as e:
+                print("⚠️ retention step failed:", e)
+        stop.wait(TICK_SEC)
+
+    if should_stop():
+        STOP_FLAG.unlink(missing_ok=True)  # نستهلك STOP حتى لا يمنع التشغيل التالي
+    print("🛑 AutoLearn daemon stopped ✅")
+
+def run_subprocess_loop():
     print("🔁 AutoLearn main loop starting...")
     while True:
         try:
@@ -27,5 +89,15 @@ def main():
         print(f"⏱ Sleeping {minutes} minutes ...")
         time.sleep(minutes * 60)
 
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--subprocess", action="store_true",
+                    help="الوضع القديم: عملية news_worker جديدة لكل دورة")
+    args = ap.parse_args()
+    if args.subprocess:
+        run_subprocess_loop()
+    else:
+        run_daemon()
+
 if __name__ == "__main__":
     main()
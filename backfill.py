@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# ترميز جماعي قابل للاستئناف: يمرّ على chunks بصفحات مرتبة بالمعرّف، ويرمّز الدفعات في مجمّع
+# عمليات بعدد الأنوية (نموذج واحد لكل عملية)، ويكتب النتائج في معاملات مجمّعة مع نقطة تفتيش
+# في جدول backfill_state — إيقاف الأمر ثم إعادته يكمل من آخر دفعة مكتوبة.
+#
+#   python backfill.py [--db ...] [--workers N]     # المقاطع التي لا متجه لها (مقاطع news_worker مثلًا)
+#   python backfill.py --reindex                    # إعادة ترميز الكل (نموذج أو تكميم جديد)
+#   python backfill.py --restart                    # تجاهل نقطة التفتيش والبدء من الأول
+import os, sys, time, argparse, collections
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import numpy as np
+import db, schema, quant, chunking
+from embedder import MODEL_NAME
+from vector_index import VectorIndex
+
+DDL = """CREATE TABLE IF NOT EXISTS backfill_state(
+    job TEXT PRIMARY KEY,
+    last_id INTEGER,
+    done INTEGER,
+    model TEXT,
+    dtype TEXT,
+    updated_at REAL
+)"""
+
+def ensure(con):
+    schema.ensure(con)  # يضيف chunks.emb لقواعد news_worker القديمة
+    con.execute(DDL); con.commit()
+
+def checkpoint(con, job: str) -> Optional[Tuple[int, int, str, str]]:
+    return con.execute("SELECT last_id, done, model, dtype FROM backfill_state WHERE job=?", (job,)).fetchone()
+
+# ---------- عمليات الترميز ----------
+_model = None
+
+def _init_worker(model_name: str, fake: bool):
+    # كل عملية تستعمل نواة واحدة؛ التوازي بين العمليات لا داخل النموذج
+    global _model
+    os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = "1"
+    if fake:
+        from bench import HashEmbed
+        _model = HashEmbed(); return
+    import torch
+    torch.set_num_threads(1)
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(model_name)
+
+def _encode(ids: List[int], texts: List[str], dtype: str, batch: int):
+    embs = _model.encode(texts, batch_size=batch, normalize_embeddings=True, convert_to_numpy=True)
+    return ids, [quant.encode(e, dtype) for e in np.asarray(embs, dtype=np.float32)]
+
+# ---------- المحرك ----------
+def _pages(con, reindex: bool, last_id: int, page: int):
+    # صفحات keyset بالمعرّف؛ --reindex يمر على كل المقاطع وإلا التي لا متجه لها فقط
+    cond = "" if reindex else "c.emb IS NULL AND "
+    while True:
+        rows = con.execute(f"SELECT c.id, {chunking.text_sql()} FROM {chunking.JOIN_DOCS} "
+                           f"WHERE {cond}(c.text IS NOT NULL OR c.stop IS NOT NULL) AND c.id > ? "
+                           f"ORDER BY c.id LIMIT ?", (last_id, page)).fetchall()
+        if not rows: return
+        last_id = rows[-1][0]
+        yield rows
+
+def run(db_path: str, reindex: bool = False, workers: int = 0, batch: int = 64, page: int = 4096,
+        commit_every: int = 8, limit: int = 0, restart: bool = False, model_name: str = None,
+        dtype: str = quant.STORE_DTYPE, fake: bool = False, index: bool = True) -> int:
+    con = db.connect(db_path); ensure(con)
+    workers = workers or os.cpu_count() or 1
+    model_name = model_name or os.getenv("AUTOLEARN_EMBED_MODEL", MODEL_NAME)
+    if fake: model_name = "hash"
+    job = "reindex" if reindex else "embed"
+    cp = checkpoint(con, job)
+    # نقطة تفتيش لنموذج أو صيغة أخرى لا تصلح للاستئناف
+    if restart or (cp and (cp[2], cp[3]) != (model_name, dtype)): cp = None
+    last_id, done = (cp[0], cp[1]) if cp else (0, 0)
+    total = con.execute(f"SELECT COUNT(*) FROM chunks WHERE id > ?" + ("" if reindex else " AND emb IS NULL"),
+                        (last_id,)).fetchone()[0]
+    if limit: total = min(total, limit)
+    print(f"▶️ {job}: {total} chunks with {workers} workers (model={model_name}, dtype={dtype}"
+          + (f", resuming after id {last_id}, {done} done" if cp else "") + ")")
+
+    # مقاطع news_worker غالبًا تحت آخر معرّف مفهرس، و sync يلحق ما فوقه فقط
+    indexed_upto = VectorIndex(db_path).last_id() if index else 0
+    lowest = None
+    t0 = last_report = time.time(); n = 0; pending_rows: list = []
+    inflight: collections.deque = collections.deque()
+
+    def write(final=False):
+        # النتائج تُكتب بترتيب الإرسال، فنقطة التفتيش = آخر معرّف مكتوب دائمًا
+        nonlocal last_id, done, pending_rows, lowest
+        if not pending_rows or (not final and len(pending_rows) < commit_every * batch): return
+        if lowest is None: lowest = pending_rows[0][1]
+        last_id = pending_rows[-1][1]; done += len(pending_rows)
+        with con:
+            con.executemany("UPDATE chunks SET emb=? WHERE id=?", pending_rows)
+            con.execute("INSERT OR REPLACE INTO backfill_state(job, last_id, done, model, dtype, updated_at) "
+                        "VALUES(?,?,?,?,?,?)", (job, last_id, done, model_name, dtype, time.time()))
+        pending_rows = []
+
+    def drain(keep: int):
+        nonlocal n, last_report
+        while len(inflight) > keep:
+            ids, blobs = inflight.popleft().result()
+            pending_rows.extend(zip(blobs, ids)); n += len(ids)
+            write()
+            if time.time() - last_report >= 5:
+                last_report = time.time()
+                print(f"  {n}/{total} chunks, {n / (last_report - t0):.1f} chunks/s, last id {pending_rows[-1][1] if pending_rows else last_id}")
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_name, fake)) as pool:
+        sent = 0
+        for rows in _pages(con, reindex, last_id, page):
+            if limit: rows = rows[:limit - sent]
+            for i in range(0, len(rows), batch):
+                part = rows[i:i + batch]
+                inflight.append(pool.submit(_encode, [r[0] for r in part], [r[1] or "" for r in part], dtype, batch))
+                drain(workers * 2)  # عدد محدود من الدفعات قيد التنفيذ: الذاكرة ثابتة مهما كبرت القاعدة
+            sent += len(rows)
+            if limit and sent >= limit: break
+        drain(0); write(final=True)
+    secs = time.time() - t0
+    if not limit or n < limit:  # انتهت المهمة: نقطة التفتيش لم تعد لازمة
+        with con:
+            con.execute("DELETE FROM backfill_state WHERE job=?", (job,))
+    print(f"✅ {job}: {n} chunks in {secs:.1f}s ({n / secs if secs else 0:.1f} chunks/s)")
+    if index and n:
+        idx = VectorIndex(db_path)
+        # إعادة الترميز، أو ملء فجوات تحت الحد الأعلى للفهرس: بناء كامل (استبدال ذري)
+        full = reindex or cp is not None or (lowest is not None and lowest <= indexed_upto)
+        added = idx.rebuild(con) if full else idx.sync(con)
+        print(f"🗂️ vector index ({idx.dtype}): {'rebuilt' if full else 'synced'}, {added} vectors")
+    return n
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=os.getenv("AUTOLEARN_DB", "/data/autolearn.db"))
+    ap.add_argument("--reindex", action="store_true", help="re-encode every chunk and rebuild the vector index")
+    ap.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    ap.add_argument("--workers", type=int, default=0, help="encoder processes (default: CPU count)")
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--page", type=int, default=4096)
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--dtype", choices=quant.DTYPES, default=quant.STORE_DTYPE)
+    ap.add_argument("--no-index", action="store_true")
+    ap.add_argument("--fake-embed", action="store_true", help="hash embeddings (no model download)")
+    args = ap.parse_args()
+    run(args.db, reindex=args.reindex, workers=args.workers, batch=args.batch, page=args.page, limit=args.limit,
+        restart=args.restart, model_name=args.model, dtype=args.dtype, fake=args.fake_embed, index=not args.no_index)
+
+if __name__ == "__main__":
+    sys.exit(main())
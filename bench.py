@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# قياس أداء محلي بلا شبكة: خادم HTTP داخلي يقدّم خلاصات RSS ومقالات HTML عربية/إنجليزية
+# مولّدة، ثم نقيس دورة news_worker.run_cycle، و Learner.process_doc، وزمن
+# Memory.search_chunks عند أحجام مدونة مختلفة، و qa.answer_question (النماذج اللغوية
+# والبحث على الويب مستبدلة). النتائج JSON لمقارنة التشغيلات.
+#
+#   python bench.py --fake-embed --sizes 1000,10000,100000 --out bench.json
+import os, sys, json, time, random, argparse, resource, tempfile, threading, platform
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List
+
+EN = ("system data model network learning energy market city research policy water signal language "
+      "software robot health climate battery satellite protocol memory vision quantum ocean").split()
+AR = ("نظام بيانات نموذج شبكة تعلم طاقة سوق مدينة بحث سياسة ماء إشارة لغة برمجيات روبوت صحة "
+      "مناخ بطارية قمر بروتوكول ذاكرة رؤية كمومي محيط").split()
+
+# ---------- المدونة المولّدة ----------
+def article(i: int, words: int = 600) -> Dict:
+    """مقال حتمي من رقمه؛ لكل مقال كلمات فريدة حتى لا يعدّه كشف التكرار نسخة."""
+    rng = random.Random(i)
+    lang = "ar" if i % 2 else "en"
+    vocab = (AR if lang == "ar" else EN) + [f"w{i}x{j}" for j in range(40)]
+    end = "." if lang == "en" else "؟" if i % 3 == 0 else "."
+    sents, n = [], 0
+    while n < words:
+        k = rng.randint(8, 20); n += k
+        sents.append(" ".join(rng.choice(vocab) for _ in range(k)) + end)
+    title = f"{'مقال' if lang == 'ar' else 'Article'} {i}"
+    return {"i": i, "lang": lang, "title": title, "text": " ".join(sents)}
+
+def _html(a: Dict) -> bytes:
+    paras = "".join(f"<p>{s}</p>" for s in a["text"].split(". "))
+    return (f"<html><head><title>{a['title']}</title><style>p{{}}</style><script>var x=1;</script></head>"
+            f"<body><nav>menu home about</nav><article><h1>{a['title']}</h1>{paras}</article>"
+            f"<footer>footer links</footer></body></html>").encode("utf-8")
+
+def _rss(base: str, feed: int, per_feed: int) -> bytes:
+    items = "".join(f"<item><title>Article {feed * per_feed + j}</title>"
+                    f"<link>{base}/a/{feed * per_feed + j}</link></item>" for j in range(per_feed))
+    return (f'<?xml version="1.0"?><rss version="2.0"><channel><title>feed {feed}</title>'
+            f"{items}</channel></rss>").encode("utf-8")
+
+class StandIn:
+    """خادم محلي: /feed/<n>.xml و /a/<i>، مع تأخير اختياري يحاكي الشبكة."""
+    def __init__(self, per_feed: int = 10, latency: float = 0.0):
+        stand = self
+        class H(BaseHTTPRequestHandler):
+            def log_message(self, *a): pass
+            def do_GET(self):
+                if stand.latency: time.sleep(stand.latency)
+                p = self.path.split("?")[0]
+                if p.startswith("/feed/"):
+                    body, ctype = _rss(stand.base, int(p[6:].split(".")[0]), stand.per_feed), "application/rss+xml"
+                elif p.startswith("/a/"):
+                    body, ctype = _html(article(int(p[3:]))), "text/html; charset=utf-8"
+                else:
+                    self.send_response(404); self.end_headers(); return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype); self.send_header("Content-Length", str(len(body)))
+                self.end_headers(); self.wfile.write(body)
+        self.per_feed, self.latency = per_feed, latency
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), H)
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def feeds(self, n: int) -> List[str]:
+        return [f"{self.base}/feed/{k}.xml" for k in range(n)]
+
+    def close(self):
+        self.httpd.shutdown()
+
+# ---------- أدوات ----------
+class HashEmbed:
+    """بديل حتمي سريع لـ SentenceTransformer (--fake-embed): كيس كلمات مُجزّأ إلى 384 بُعدًا."""
+    def encode(self, texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True):
+        out = np.zeros((len(texts), 384), dtype=np.float32)
+        for r, t in enumerate(texts):
+            for w in t.split():
+                out[r, hash(w) % 384] += 1.0
+        n = np.linalg.norm(out, axis=1, keepdims=True); n[n == 0] = 1
+        return out / n
+
+def peak_rss_mb() -> float:
+    # ru_maxrss بالكيلوبايت على لينكس وبالبايت على ماك
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(r / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def pct(xs: List[float], q: float) -> float:
+    return round(float(np.percentile(xs, q)) * 1000, 3) if xs else 0.0
+
+def timed(fn, *args):
+    t = time.perf_counter(); out = fn(*args)
+    return out, time.perf_counter() - t
+
+# ---------- المراحل ----------
+def bench_ingest(tmp: str, stand: StandIn, feeds: int) -> Dict:
+    import news_worker, db
+    news_worker.DB_PATH = os.path.join(tmp, "news.db")
+    cfg = {"rss_feeds": stand.feeds(feeds), "arxiv_queries": [], "learning_keywords": [],
+           "personal_files_dir": os.path.join(tmp, "inbox"), "blocked_domains": [],
+           # host_rate 0: بلا حد معدل، فالقياس للمحرك لا لدلو الرموز أمام الخادم المحلي
+           "crawl": {"concurrency": 8, "per_host": 8, "queue_size": 32, "extract_workers": 2, "host_rate": 0}}
+    stats, secs = timed(news_worker.run_cycle, cfg, ("rss",))
+    con = db.connect(news_worker.DB_PATH)
+    docs, chunks = (con.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("docs", "chunks"))
+    return {"docs": docs, "chunks": chunks, "seconds": round(secs, 3),
+            "docs_per_sec": round(docs / secs, 2), "chunks_per_sec": round(chunks / secs, 2), "cycle": stats}
+
+def bench_learner(mem, n_docs: int) -> Dict:
+    from learner import Learner
+    L = Learner(mem); docs = [article(100000 + i, 1200) for i in range(n_docs)]
+    ids = [mem.add_doc(f"bench://learn/{a['i']}", a["title"], a["text"], "bench", a["lang"]) for a in docs]
+    before = len(mem.index); t = time.perf_counter()
+    for (doc_id, new), a in zip(ids, docs):
+        if new: L.process_doc(doc_id, a["text"])  # المكرر يحمل مقاطع أصله
+    secs = time.perf_counter() - t; chunks = len(mem.index) - before
+    return {"docs": n_docs, "chunks": chunks, "seconds": round(secs, 3),
+            "docs_per_sec": round(n_docs / secs, 2), "chunks_per_sec": round(chunks / secs, 2)}
+
+def bench_embed(n: int = 2000) -> Dict:
+    from embedder import get_embedder
+    texts = [article(200000 + i, 60)["text"] for i in range(n)]
+    _, secs = timed(get_embedder().encode, texts)
+    return {"texts": n, "seconds": round(secs, 3), "embeddings_per_sec": round(n / secs, 1)}
+
+def grow(mem, target: int, doc_chunks: int = 10, words: int = 600):
+    """أضف مستندات مولّدة حتى يبلغ عدد المقاطع المفهرسة target."""
+    import chunking
+    from embedder import get_embedder
+    i = 300000 + len(mem.index)
+    while len(mem.index) < target:
+        n = min(50, (target - len(mem.index)) // doc_chunks + 1)
+        batch = [article(i + j, words) for j in range(n)]; i += n
+        spans = [list(chunking.spans(a["text"], len(a["text"]) // doc_chunks + 1)) for a in batch]
+        embs = get_embedder().encode([t for a, sp in zip(batch, spans) for t in chunking.materialize(a["text"], sp)])
+        k = 0
+        for a, sp in zip(batch, spans):
+            mem.add_document_with_chunks(f"bench://grow/{a['i']}", a["title"], a["text"], "bench", a["lang"],
+                                         sp, embs[k:k + len(sp)]); k += len(sp)
+
+def bench_search(mem, sizes: List[int], queries: int) -> Dict:
+    out = {}
+    qs = [" ".join(article(400000 + j, 12)["text"].split()[:6]) for j in range(queries)]
+    for size in sizes:
+        _, build = timed(grow, mem, size)
+        mem.search_chunks(qs[0])  # إحماء (mmap + النموذج)
+        vec, lex = [], []
+        for q in qs:
+            vec.append(timed(mem.search_chunks, q, 6)[1])
+            lex.append(timed(mem.search_lexical, q, 6)[1])
+        out[str(size)] = {"chunks": len(mem.index), "build_seconds": round(build, 2),
+                          "vector_p50_ms": pct(vec, 50), "vector_p99_ms": pct(vec, 99),
+                          "lexical_p50_ms": pct(lex, 50), "lexical_p99_ms": pct(lex, 99),
+                          "peak_rss_mb": peak_rss_mb()}
+        print(f"  search @{size}: vector p50 {out[str(size)]['vector_p50_ms']}ms "
+              f"p99 {out[str(size)]['vector_p99_ms']}ms")
+    return out
+
+def bench_qa(db_path: str, stand: StandIn, n: int) -> Dict:
+    try:
+        import qa
+    except Exception as e:  # مكتبات البحث غير مثبّتة
+        return {"skipped": f"{type(e).__name__}: {e}"}
+    qa.DB_PATH = db_path; qa._cache = None
+    qa._search_web = lambda q, k=5: [(f"Article {j}", f"{stand.base}/a/{j}") for j in range(k)]
+    qa._llm_answer = lambda prompt: "stub answer"
+    lat = []
+    for j in range(n):
+        lat.append(timed(qa.answer_question, f"question {j} about {EN[j % len(EN)]} w{j}x1")[1])
+    return {"questions": n, "p50_ms": pct(lat, 50), "p99_ms": pct(lat, 99)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000", help="corpus sizes in chunks for search latency")
+    ap.add_argument("--feeds", type=int, default=10, help="RSS feeds (10 articles each) for the ingest cycle")
+    ap.add_argument("--learn-docs", type=int, default=50)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--qa", type=int, default=20, help="questions for qa.answer_question (0 to skip)")
+    ap.add_argument("--latency", type=float, default=0.0, help="simulated per-request server latency (s)")
+    ap.add_argument("--fake-embed", action="store_true", help="hashing embedder instead of the real model")
+    ap.add_argument("--out", default="bench.json")
+    args = ap.parse_args()
+
+    from embedder import get_embedder
+    if args.fake_embed: get_embedder()._model = HashEmbed()
+    tmp = tempfile.mkdtemp(prefix="autolearn-bench-")
+    stand = StandIn(latency=args.latency)
+    from memory import Memory
+    mem = Memory(os.path.join(tmp, "memory.db")); mem.init()
+    res = {"started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+           "embedder": "hash" if args.fake_embed else get_embedder().model_name, "args": vars(args)}
+    try:
+        print("▶️ ingest (news_worker.run_cycle)"); res["ingest"] = bench_ingest(tmp, stand, args.feeds)
+        print("▶️ embeddings"); res["embed"] = bench_embed()
+        print("▶️ learner (Learner.process_doc)"); res["learner"] = bench_learner(mem, args.learn_docs)
+        print("▶️ search (Memory.search_chunks)")
+        res["search"] = bench_search(mem, sorted(int(s) for s in args.sizes.split(",") if s), args.queries)
+        if args.qa:
+            print("▶️ qa (qa.answer_question)"); res["qa"] = bench_qa(mem.db_path, stand, args.qa)
+    finally:
+        stand.close()
+    res["peak_rss_mb"] = peak_rss_mb()
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=2)
+    print(json.dumps({k: v for k, v in res.items() if k != "args"}, ensure_ascii=False, indent=2))
+    print("📄", args.out)
+
+if __name__ == "__main__":
+    sys.exit(main())
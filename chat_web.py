@@ -1,34 +1,114 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-import os, json, glob
-from openai import OpenAI
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import os, re, json, glob, math, time, threading
+from collections import Counter
+from openai import AsyncOpenAI
+import fts
+from memory import get_memory
+from answer_cache import AnswerCache
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+# عميل غير متزامن: لا يحجز خيطًا طوال التوليد. OPENAI_BASE_URL يوجّهه لخادم متوافق محلي للاختبار.
+client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
 DATA_DIR = "/data"
-SNIPPETS = glob.glob(os.path.join(DATA_DIR, "snippets/*.jsonl"))
+SNIPPETS_GLOB = os.path.join(DATA_DIR, "snippets/*.jsonl")
+DB_PATH = os.getenv("AUTOLEARN_DB", os.path.join(DATA_DIR, "autolearn.db"))
+REFRESH_SEC = 30
 
-def load_context(max_lines=30):
-    ctx = []
-    for p in SNIPPETS:
+def _tokens(text):
+    return [w for w in re.findall(r"\w+", fts.normalize(text.lower())) if len(w) > 1]
+
+class SnippetIndex:
+    """فهرس في الذاكرة لملفات المقتطفات، مفتاحه (المسار، mtime)؛ يُحدَّث تزايديًا
+    مرة كل REFRESH_SEC على الأكثر، فلا قراءة من القرص مع كل سؤال."""
+    def __init__(self, pattern, max_lines=500):
+        self.pattern = pattern
+        self.max_lines = max_lines
+        self.files = {}          # path -> (mtime, [(text, Counter)])
+        self.df = Counter()
+        self.n = 0
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def _parse(self, p):
+        out = []
+        with open(p, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                if i >= self.max_lines: break
+                try:
+                    obj = json.loads(line)
+                    txt = (obj.get("text") or obj.get("content") or "").strip()
+                    if txt: out.append((txt, Counter(_tokens(txt))))
+                except Exception:
+                    continue
+        return out
+
+    def _drop(self, p):
+        for _, tf in self.files.pop(p, (0, []))[1]:
+            self.df.subtract(tf.keys()); self.n -= 1
+
+    def refresh(self, force=False):
+        with self.lock:
+            if not force and time.time() - self.checked < REFRESH_SEC: return
+            self.checked = time.time()
+            paths = set(glob.glob(self.pattern))
+            for p in set(self.files) - paths:
+                self._drop(p)
+            for p in paths:
+                try: m = os.path.getmtime(p)
+                except OSError: continue
+                if p in self.files and self.files[p][0] == m: continue
+                self._drop(p)
+                try: entries = self._parse(p)
+                except Exception: continue
+                self.files[p] = (m, entries)
+                for _, tf in entries:
+                    self.df.update(tf.keys()); self.n += 1
+
+    def search(self, q, k=5):
+        self.refresh()
+        qt = set(_tokens(q))
+        # لقطة تحت القفل: refresh في خيط آخر يعدّل files و df
+        with self.lock:
+            n = self.n
+            df = {t: self.df[t] for t in qt}
+            entries_all = [entries for _, entries in self.files.values()]
+        if not qt or not n: return []
+        scored = []
+        for entries in entries_all:
+            for txt, tf in entries:
+                s = sum(tf[t] * math.log(1 + n / df[t]) for t in qt if t in tf and df[t] > 0)
+                if s > 0: scored.append((s, txt))
+        scored.sort(key=lambda x: -x[0])
+        return [t for _, t in scored[:k]]
+
+SNIPPETS = SnippetIndex(SNIPPETS_GLOB)
+_cache = None
+
+def answer_cache():
+    # الذاكرة الدلالية اختيارية: إن تعذّر فتح القاعدة نعمل بدونها
+    global _cache
+    if _cache is None:
+        try: _cache = AnswerCache(DB_PATH, scope="chat")
+        except Exception: _cache = False
+    return _cache or None
+
+def load_context(q, k=6):
+    # أقرب المقتطفات للسؤال + أقرب مقاطع autolearn.db عبر فهرس FTS5
+    ctx = SNIPPETS.search(q, k=k)
+    if os.path.exists(DB_PATH):
         try:
-            with open(p, "r", encoding="utf-8") as f:
-                for i, line in enumerate(f):
-                    if i >= max_lines: break
-                    try:
-                        obj = json.loads(line)
-                        txt = obj.get("text") or obj.get("content") or ""
-                        if txt: ctx.append(txt.strip())
-                    except:
-                        continue
-        except:
-            continue
+            ctx += [h["text"][:800] for h in get_memory(DB_PATH).search_lexical(q, top_k=k)]
+        except Exception:
+            pass
     return ctx
 
 def build_prompt(q: str):
-    ctx = load_context()
-    ctx_text = "\n- ".join(ctx[:20]) if ctx else "لا توجد معرفة متاحة بعد."
+    ctx = load_context(q)
+    ctx_text = "\n- ".join(ctx) if ctx else "لا توجد معرفة متاحة بعد."
     return (
         "أنت مساعد عربي دقيق ومختصر. استخدم السياق التالي إن كان مفيدًا.\n\n"
         f"السياق:\n- {ctx_text}\n\n"
@@ -71,9 +151,24 @@ async function askFn(){
   if(!qq){ ans.textContent='اكتب سؤالاً أولاً.'; return; }
   ans.textContent='...جارِ توليد الإجابة';
   try{
-    const r = await fetch('/ask', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({q:qq})});
-    const j = await r.json();
-    ans.textContent = j.answer || j.detail || 'لم يتم الحصول على إجابة.';
+    // نعرض الرموز فور وصولها عبر SSE
+    const r = await fetch('/ask/stream', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({q:qq})});
+    const reader = r.body.getReader(), dec = new TextDecoder();
+    let buf = '', started = false;
+    for(;;){
+      const {value, done} = await reader.read();
+      if(done) break;
+      buf += dec.decode(value, {stream:true});
+      let i;
+      while((i = buf.indexOf('\n\n')) >= 0){
+        const ev = buf.slice(0, i); buf = buf.slice(i+2);
+        if(!ev.startsWith('data: ')) continue;
+        const j = JSON.parse(ev.slice(6));
+        if(j.delta){ if(!started){ ans.textContent=''; started=true; } ans.textContent += j.delta; }
+        if(j.answer){ ans.textContent = j.answer; started = true; }
+      }
+    }
+    if(!started) ans.textContent = 'لم يتم الحصول على إجابة.';
   }catch(e){ ans.textContent = 'خطأ في الاتصال: '+e; }
 }
 ask.onclick = askFn;
@@ -81,6 +176,18 @@ q.addEventListener('keydown', e => { if(e.key==='Enter') askFn(); });
 </script>
 """
 
+async def _prepare(q: str):
+    # الترميز وقراءة القاعدة متزامنان، فنشغلهما خارج حلقة الأحداث
+    cache, cached, qv = await run_in_threadpool(answer_cache), None, None
+    if cache:
+        try: cached, qv = await run_in_threadpool(cache.get, q)
+        except Exception: cache = None
+    prompt = None if cached else await run_in_threadpool(build_prompt, q)
+    return cache, cached, qv, prompt
+
+def _messages(prompt):
+    return [{"role":"user","content":prompt}]
+
 @app.post("/ask")
 async def ask(request: Request):
     data = await request.json()
@@ -90,13 +197,55 @@ async def ask(request: Request):
     if not client:
         return JSONResponse({"answer":"لم يتم إعداد OPENAI_API_KEY في Render."}, status_code=200)
 
-    prompt = build_prompt(q)
+    cache, cached, qv, prompt = await _prepare(q)
+    if cached:
+        return {**cached, "cached": True}
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role":"user","content":prompt}],
+        resp = await client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=_messages(prompt),
             temperature=0.2,
         )
-        return {"answer": resp.choices[0].message.content.strip()}
+        out = {"answer": resp.choices[0].message.content.strip()}
+        if cache: await run_in_threadpool(cache.put, q, qv, out)
+        return out
     except Exception as e:
         return JSONResponse({"answer": f"تعذّر التوليد: {e}"}, status_code=200)
+
+def _sse(obj) -> str:
+    return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(request: Request):
+    data = await request.json()
+    q = (data.get("q") or "").strip()
+
+    async def events():
+        if not q:
+            yield _sse({"answer": "الرجاء كتابة سؤال.", "done": True}); return
+        if not client:
+            yield _sse({"answer": "لم يتم إعداد OPENAI_API_KEY في Render.", "done": True}); return
+        cache, cached, qv, prompt = await _prepare(q)
+        if cached:
+            yield _sse({**cached, "cached": True, "done": True}); return
+        parts = []
+        try:
+            stream = await client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=_messages(prompt),
+                temperature=0.2,
+                stream=True,
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield _sse({"delta": delta})
+        except Exception as e:
+            yield _sse({"answer": f"تعذّر التوليد: {e}", "done": True}); return
+        out = {"answer": "".join(parts).strip()}
+        if cache and out["answer"]: await run_in_threadpool(cache.put, q, qv, out)
+        yield _sse({"done": True})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# محرك تقطيع واحد يراعي حدود الجمل ويُنتج مواضع (start, stop) داخل docs.text بدل نسخ النص.
+# المقطع يُخزَّن في chunks كمدى فوق نص المستند، ونصه يُجسَّد بـ substr() فقط عند الحاجة
+# (الفائزون في البحث، الترميز، فهرس FTS). التقطيع مولِّد فلا تُبنى سلاسل مدمجة أبدًا.
+#
+#   python chunking.py compact [--db ...] [--vacuum]   # تحويل المقاطع المنسوخة القديمة إلى مدى
+import os, sys, re, time, argparse
+from typing import Iterator, List, Tuple
+
+_SENT_END = re.compile(r"(?<=[.!?؟。\n])\s+")
+_WORD = re.compile(r"\w+")
+
+def _pieces(text: str, size: int) -> Iterator[Tuple[int, int]]:
+    # جمل النص كمواضع؛ الجملة الأطول من size تُقسم عند آخر مسافة قبل الحد
+    pos, n = 0, len(text)
+    ends = [m.span() for m in _SENT_END.finditer(text)] + [(n, n)]
+    for a_end, next_start in ends:
+        a, b = pos, a_end
+        pos = next_start
+        while b - a > size:
+            cut = text.rfind(" ", a + 1, a + size)
+            cut = cut if cut > a else a + size
+            yield a, cut
+            a = cut
+            while a < b and text[a].isspace(): a += 1
+        if b > a: yield a, b
+
+def spans(text: str, size: int = 1200, overlap: int = 0, min_words: int = 0) -> Iterator[Tuple[int, int]]:
+    """مقاطع حتى size حرفًا تنتهي عند حدود الجمل، مع تداخل حتى overlap حرفًا."""
+    text = text or ""
+    window: List[Tuple[int, int]] = []
+    def emit():
+        a, b = window[0][0], window[-1][1]
+        if not min_words or len(_WORD.findall(text, a, b)) > min_words: return (a, b)
+    for a, b in _pieces(text, size):
+        if window and b - window[0][0] > size:
+            out = emit()
+            if out: yield out
+            start, end = window[0][0], window[-1][1]
+            # نحتفظ بالجمل الأخيرة ضمن التداخل، بشرط أن يتقدم المقطع وأن تتسع للجملة التالية
+            window = [s for s in window if s[0] >= end - overlap and s[0] > start] if overlap else []
+            if window and b - window[0][0] > size: window = []
+        window.append((a, b))
+    if window:
+        out = emit()
+        if out: yield out
+
+def materialize(text: str, spans: List[Tuple[int, int]]) -> List[str]:
+    return [text[a:b] for a, b in spans]
+
+# ---------- SQL ----------
+# نص المقطع: العمود text للصفوف القديمة، وإلا مدى داخل docs.text (substr يبدأ من 1)
+def text_sql(c: str = "c", d: str = "d") -> str:
+    return f"COALESCE({c}.text, substr({d}.text, {c}.start + 1, {c}.stop - {c}.start))"
+
+JOIN_DOCS = "chunks c LEFT JOIN docs d ON d.id = c.doc_id"
+
+def row_text_sql(row: str) -> str:
+    """نفس text_sql لصف داخل trigger (new/old)."""
+    return (f"COALESCE({row}.text, (SELECT substr(d.text, {row}.start + 1, {row}.stop - {row}.start) "
+            f"FROM docs d WHERE d.id = {row}.doc_id))")
+
+def ensure(con):
+    cols = [r[1] for r in con.execute("PRAGMA table_info(chunks)")]
+    for col in ("start", "stop"):
+        if col not in cols: con.execute(f"ALTER TABLE chunks ADD COLUMN {col} INTEGER")
+    con.commit()
+
+# ---------- أداة سطر الأوامر ----------
+def compact(db_path: str, page: int = 200, vacuum: bool = False):
+    """المقاطع القديمة التي نسخت نصها: إن وُجد النص حرفيًا في docs.text يُستبدل بمداه."""
+    import db
+    con = db.connect(db_path); ensure(con)
+    last = done = kept = 0; t0 = time.time(); before = os.path.getsize(db_path)
+    while True:
+        docs = con.execute("SELECT DISTINCT doc_id FROM chunks WHERE text IS NOT NULL AND doc_id > ? "
+                           "ORDER BY doc_id LIMIT ?", (last, page)).fetchall()
+        if not docs: break
+        last = docs[-1][0]
+        todo = []
+        for (doc_id,) in docs:
+            row = con.execute("SELECT text FROM docs WHERE id=?", (doc_id,)).fetchone()
+            body, pos = (row and row[0]) or "", 0
+            for cid, t in con.execute("SELECT id, text FROM chunks WHERE doc_id=? AND text IS NOT NULL ORDER BY id",
+                                      (doc_id,)).fetchall():
+                a = body.find(t, pos) if t else -1
+                if a < 0: a = body.find(t) if t else -1
+                if a < 0: kept += 1; continue
+                todo.append((a, a + len(t), cid)); pos = a + 1
+        with con:
+            con.executemany("UPDATE chunks SET start=?, stop=?, text=NULL WHERE id=?", todo)
+        done += len(todo)
+    if vacuum:
+        con.execute("VACUUM"); con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"converted {done} chunks to spans ({kept} kept as text) in {time.time() - t0:.1f}s; "
+          f"db {before / 2**20:.1f}MB → {os.path.getsize(db_path) / 2**20:.1f}MB"
+          + ("" if vacuum else " (run with --vacuum to reclaim space)"))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["compact"])
+    ap.add_argument("--db", default=os.getenv("AUTOLEARN_DB", "/data/autolearn.db"))
+    ap.add_argument("--vacuum", action="store_true")
+    args = ap.parse_args()
+    compact(args.db, vacuum=args.vacuum)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# عدّادات رخيصة بدل SELECT COUNT(*): جدول صغير تحدّثه triggers عند كل إدراج/حذف في
+# docs/chunks/insights (ومنها عدد المستندات لكل مصدر)، مع ذاكرة قصيرة داخل العملية.
+# وهنا أيضًا مدرّجات زمن البحث: تُجمع في الذاكرة وتُكتب للقاعدة كل FLUSH_SEC حتى
+# تقرأها لوحة الإحصاءات من عملية أخرى.
+import os, time, threading
+from collections import deque
+from typing import Dict, List, Tuple
+import db
+
+CACHE_SEC = float(os.getenv("AUTOLEARN_STATS_CACHE_SEC", "5"))
+FLUSH_SEC = 10.0
+# حدود دلاء زمن البحث بالثواني (Prometheus le)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TABLES = ("docs", "chunks", "insights")
+# صفوف خاصة في search_latency: العدد الكلي ومجموع الأزمنة (ميكروثانية)
+COUNT, SUM_US = -1.0, -2.0
+
+def _upsert(name_expr: str, delta: int) -> str:
+    return (f"INSERT INTO counters(name, v) VALUES({name_expr}, {delta}) "
+            f"ON CONFLICT(name) DO UPDATE SET v = v + {delta};")
+
+def ddl() -> List[str]:
+    qs = ["CREATE TABLE IF NOT EXISTS counters(name TEXT PRIMARY KEY, v INTEGER)",
+          """CREATE TABLE IF NOT EXISTS search_latency(
+              kind TEXT, le REAL, n INTEGER, PRIMARY KEY(kind, le)) WITHOUT ROWID"""]
+    for t in TABLES:
+        # docs_ingested لا ينقص أبدًا (معدل الإدخال)، ولكل مصدر عدّاده
+        extra_ai = (_upsert("'docs_ingested'", 1) + _upsert("'source:' || COALESCE(new.source, '')", 1)
+                    if t == "docs" else "")
+        extra_ad = _upsert("'source:' || COALESCE(old.source, '')", -1) if t == "docs" else ""
+        qs.append(f"CREATE TRIGGER IF NOT EXISTS {t}_cnt_ai AFTER INSERT ON {t} BEGIN "
+                  f"{_upsert(repr(t), 1)} {extra_ai} END")
+        qs.append(f"CREATE TRIGGER IF NOT EXISTS {t}_cnt_ad AFTER DELETE ON {t} BEGIN "
+                  f"{_upsert(repr(t), -1)} {extra_ad} END")
+    return qs
+
+def ensure(con):
+    fresh = con.execute("SELECT 1 FROM sqlite_master WHERE name='counters'").fetchone() is None
+    for q in ddl(): con.execute(q)
+    if fresh:
+        # العدّ الكامل مرة واحدة، ثم تتولى الـtriggers
+        for t in TABLES:
+            con.execute(f"INSERT OR REPLACE INTO counters(name, v) SELECT ?, COUNT(*) FROM {t}", (t,))
+        con.execute("INSERT OR REPLACE INTO counters(name, v) SELECT 'docs_ingested', COUNT(*) FROM docs")
+        con.execute("INSERT OR REPLACE INTO counters(name, v) SELECT 'source:' || COALESCE(source, ''), COUNT(*) "
+                    "FROM docs GROUP BY 1")
+    con.commit()
+
+def read(con) -> Dict[str, int]:
+    try:
+        return dict(con.execute("SELECT name, v FROM counters").fetchall())
+    except Exception:
+        return {}
+
+def latency(con) -> Dict[str, Dict[float, int]]:
+    out: Dict[str, Dict[float, int]] = {}
+    try:
+        for kind, le, n in con.execute("SELECT kind, le, n FROM search_latency ORDER BY kind, le"):
+            out.setdefault(kind, {})[le] = n
+    except Exception:
+        pass
+    return out
+
+class Snapshot:
+    """عدّادات مخزّنة لثوانٍ، مع معدل الإدخال من عيّنات العملية نفسها.
+    reader بديل عن قراءة db_path (مجموع عدّادات الشظايا مثلًا)."""
+    def __init__(self, db_path: str, ttl: float = CACHE_SEC, window: float = 600.0, reader=None):
+        self.db_path, self.ttl, self.window = db_path, ttl, window
+        self.reader = reader or (lambda: read(db.connect(self.db_path)))
+        self._lock = threading.Lock()
+        self._at, self._data = 0.0, {}
+        self._samples: deque = deque()
+
+    def get(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            if now - self._at > self.ttl:
+                self._data = self.reader(); self._at = now
+                if "docs_ingested" in self._data:
+                    self._samples.append((now, self._data["docs_ingested"]))
+                while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                    self._samples.popleft()
+            return self._data
+
+    def ingest_rate(self) -> float:
+        """مستندات/دقيقة خلال نافذة العيّنات."""
+        with self._lock:
+            if len(self._samples) < 2: return 0.0
+            (t0, n0), (t1, n1) = self._samples[0], self._samples[-1]
+        return round(max(0, n1 - n0) * 60.0 / (t1 - t0), 3) if t1 > t0 else 0.0
+
+class LatencyRecorder:
+    """مدرّج زمن البحث لكل نوع؛ تُضاف الفروق إلى search_latency دوريًا."""
+    def __init__(self, db_path: str, flush_sec: float = FLUSH_SEC):
+        self.db_path, self.flush_sec = db_path, flush_sec
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, float], int] = {}
+        self._at = 0.0  # أول قياس يُكتب فورًا
+
+    def observe(self, kind: str, seconds: float):
+        le = next((b for b in BUCKETS if seconds <= b), float("inf"))
+        with self._lock:
+            for k, n in (((kind, le), 1), ((kind, COUNT), 1), ((kind, SUM_US), int(seconds * 1e6))):
+                self._pending[k] = self._pending.get(k, 0) + n
+            due = time.time() - self._at >= self.flush_sec
+        if due: self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending, self._at = self._pending, {}, time.time()
+        if not rows: return
+        try:
+            con = db.connect(self.db_path)
+            with con:
+                con.executemany("INSERT INTO search_latency(kind, le, n) VALUES(?,?,?) "
+                                "ON CONFLICT(kind, le) DO UPDATE SET n = n + excluded.n",
+                                [(k, le, n) for (k, le), n in rows.items()])
+        except Exception:
+            pass  # القياس لا يعطّل البحث
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# محرك زحف متوازٍ لـ news_worker:
+#   جلب (مجمّع خيوط بحد عام + حد لكل مضيف) → استخراج → كشف التكرار + تقطيع → تخزين (كاتب واحد)
+# المراحل متصلة بطوابير محدودة، فيتداخل التحليل مع انتظار الشبكة ويُضغط الجلب للخلف
+# إذا تأخرت المراحل اللاحقة.
+import queue, threading, time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from typing import Callable, Dict
+
+_DONE = object()
+
+class CrawlPipeline:
+    def __init__(self, cfg: Dict, fetch: Callable, extract: Callable, chunk: Callable, store: Callable,
+                 dedupe: Callable = None):
+        c = (cfg or {}).get("crawl", {}) or {}
+        self.concurrency = int(c.get("concurrency", 8))
+        self.per_host = int(c.get("per_host", 2))
+        self.n_extract = int(c.get("extract_workers", 2))
+        qsize = int(c.get("queue_size", 32))
+        self._fetch, self._extract, self._chunk, self._store = fetch, extract, chunk, store
+        self._dedupe = dedupe
+
+        self.extract_q: "queue.Queue" = queue.Queue(qsize)
+        self.chunk_q: "queue.Queue" = queue.Queue(qsize)
+        self.store_q: "queue.Queue" = queue.Queue(qsize)
+        self.pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="fetch")
+
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = defaultdict(int)
+        self._waiting: Dict[str, deque] = defaultdict(deque)
+        self._seen = set()
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        # العدّادات تُزاد من خيوط الجلب والمراحل معًا، فلها قفلها الخاص
+        self.stats = defaultdict(int)
+        self._stats_lock = threading.Lock()
+        self._threads = []
+
+    # ---------- دورة الحياة ----------
+    def __enter__(self):
+        self.t0 = time.time()
+        self._threads = (
+            [self._stage(self.extract_q, self.chunk_q, self._do_extract, f"extract-{i}") for i in range(self.n_extract)],
+            [self._stage(self.chunk_q, self.store_q, self._do_chunk, "chunk")],
+            [self._stage(self.store_q, None, self._do_store, "store")],
+        )
+        return self
+
+    def __exit__(self, *exc):
+        # انتظر نفاد مهام الجلب ثم أغلق المراحل بالترتيب
+        with self._idle:
+            while self._pending:
+                self._idle.wait()
+        self.pool.shutdown(wait=True)
+        for q, group in zip((self.extract_q, self.chunk_q, self.store_q), self._threads):
+            for _ in group: q.put(_DONE)
+            for t in group: t.join()
+        self.stats["seconds"] = round(time.time() - self.t0, 2)
+        return False
+
+    def count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _stage(self, inq, outq, fn, name):
+        def loop():
+            while True:
+                item = inq.get()
+                if item is _DONE: break
+                try:
+                    out = fn(*item)
+                except Exception as ex:
+                    self.count(f"{name.split('-')[0]}_errors")
+                    print(f"{name} error:", item[0], ex)
+                    continue
+                if out is not None and outq is not None:
+                    outq.put(out)
+        t = threading.Thread(target=loop, name=name, daemon=True); t.start()
+        return t
+
+    # ---------- مهام الشبكة ----------
+    def spawn(self, url: str, fn: Callable, *args):
+        """شغّل fn(*args) في مجمّع الجلب مع احترام حد المضيف المستخرج من url."""
+        with self._lock:
+            self._pending += 1
+        self.pool.submit(self._run, urlparse(url).hostname or "", fn, args)
+
+    def fetch(self, url: str, source: str):
+        with self._lock:
+            if url in self._seen: return
+            self._seen.add(url)
+        self.spawn(url, self._do_fetch, url, source)
+
+    def put_text(self, url: str, title: str, text: str, source: str):
+        """نص جاهز (ملفات محلية): يدخل مرحلة التقطيع مباشرة."""
+        self.chunk_q.put((url, title, text, source))
+
+    def _run(self, host, fn, args):
+        with self._lock:
+            if self._active[host] >= self.per_host:
+                # لا نحجز خيطًا بالانتظار: نؤجل المهمة حتى يتحرر مكان لهذا المضيف
+                self._waiting[host].append((fn, args)); return
+            self._active[host] += 1
+        try:
+            fn(*args)
+        except Exception as ex:
+            self.count("fetch_errors")
+            print("fetch error:", host, ex)
+        finally:
+            with self._lock:
+                self._active[host] -= 1
+                nxt = self._waiting[host].popleft() if self._waiting[host] else None
+                self._pending -= 1
+                if not self._pending: self._idle.notify_all()
+            if nxt is not None:
+                # المهمة المؤجلة ما زالت محسوبة في _pending منذ spawn
+                self.pool.submit(self._run, host, *nxt)
+
+    # ---------- المراحل ----------
+    def _do_fetch(self, url, source):
+        html = self._fetch(url)
+        self.count("fetched")
+        if html: self.extract_q.put((url, html, source))
+
+    def _do_extract(self, url, html, source):
+        title, text = self._extract(url, html)
+        if title and text: return (url, title, text, source)
+
+    def _do_chunk(self, url, title, text, source):
+        # شبه المكرر يُرفض قبل التقطيع والتخزين
+        if self._dedupe and self._dedupe(url, text):
+            self.count("near_dups")
+            return None
+        return (url, title, text, source, self._chunk(text))
+
+    def _do_store(self, url, title, text, source, chunks):
+        # store يعيد None إن لم يُكتب صف جديد (رابط موجود، شبه مكرر، أو نص قصير)
+        self.count("stored" if self._store(url, title, text, source, chunks) is not None else "skipped")
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# طبقة اتصال SQLite مشتركة: اتصال طويل العمر لكل خيط ولكل قاعدة، بوضع WAL
+# (القارئ لا ينتظر الكاتب) وإعدادات مضبوطة للإدخال بالجملة.
+import sqlite3, threading, weakref
+from typing import Dict
+
+PRAGMAS = (
+    # يسري على القاعدة الجديدة فقط، وقبل WAL؛ القديمة تحتاج VACUUM مرة (retention.py convert)
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # آمن مع WAL ويوفّر fsync لكل commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-32000",      # ~32MB
+    "PRAGMA mmap_size=268435456",    # 256MB
+    "PRAGMA busy_timeout=10000",
+    "PRAGMA journal_size_limit=67108864",  # ملف WAL يُقص إلى 64MB بعد كل checkpoint
+)
+
+# قاعدة مختومة (شظية قديمة): قراءة فقط بلا WAL، وصفحاتها عبر mmap
+RO_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=268435456",
+)
+
+class _Connection(sqlite3.Connection):
+    pass  # يقبل weakref، فاتصال الخيط المنتهي لا يبقى حيًا في _open
+
+_local = threading.local()
+# كل اتصالات القاعدة في كل الخيوط، وجيلها: close_all يغلقها ويرفع الجيل فيعيد كل خيط فتح اتصاله
+_lock = threading.Lock()
+_open: Dict[str, "weakref.WeakSet"] = {}
+_gen: Dict[str, int] = {}
+
+def connect(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """اتصال هذا الخيط بالقاعدة (يُنشأ مرة ويُعاد استخدامه). استعمل `with con:` للمعاملات."""
+    cons = getattr(_local, "cons", None)
+    if cons is None:
+        cons = _local.cons = {}
+    key = (db_path, readonly) if readonly else db_path
+    got = cons.get(key)
+    if got is not None and got[1] == _gen.get(db_path, 0): return got[0]
+    # check_same_thread=False فقط ليُغلق close_all اتصالات الخيوط الأخرى؛ الاستعمال يبقى لخيطه
+    if readonly:
+        con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30, check_same_thread=False,
+                              factory=_Connection)
+    else:
+        con = sqlite3.connect(db_path, timeout=30, check_same_thread=False, factory=_Connection)
+    for p in (RO_PRAGMAS if readonly else PRAGMAS):
+        con.execute(p)
+    with _lock:
+        cons[key] = (con, _gen.get(db_path, 0))
+        _open.setdefault(db_path, weakref.WeakSet()).add(con)
+    return con
+
+def close(db_path: str = None):
+    """أغلق اتصالات هذا الخيط (كلها أو لقاعدة واحدة)."""
+    cons = getattr(_local, "cons", None) or {}
+    for p in ([db_path, (db_path, True)] if db_path else list(cons)):
+        got = cons.pop(p, None)
+        if got is None: continue
+        with _lock:
+            _open.get(p[0] if isinstance(p, tuple) else p, weakref.WeakSet()).discard(got[0])
+        got[0].close()
+
+def close_all(db_path: str):
+    """أغلق اتصالات القاعدة في كل الخيوط (قبل حذف ملفاتها، shards.drop)."""
+    with _lock:
+        _gen[db_path] = _gen.get(db_path, 0) + 1
+        cons = list(_open.pop(db_path, ()))
+    for con in cons:
+        try: con.close()
+        except sqlite3.Error: pass
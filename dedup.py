@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# كشف المستندات شبه المكررة عند الإدخال: بصمة SimHash (64 بت) على مقاطع من 3 كلمات،
+# مقسّمة إلى 4 نطاقات × 16 بت في جدول LSH. أي مستندين بينهما ≤ 3 بتات مختلفة يشتركان
+# حتمًا في نطاق واحد على الأقل، فالبحث استعلام مفهرس بدل مقارنة كل المستندات.
+import re, hashlib, datetime as dt, numpy as np
+from typing import Dict, List, Optional, Tuple
+import db
+
+BANDS = 4
+BAND_BITS = 16
+MAX_DISTANCE = 3
+_SHIFTS = np.arange(64, dtype=np.uint64)
+
+DDL = (
+    """CREATE TABLE IF NOT EXISTS doc_fingerprints(
+        doc_id INTEGER PRIMARY KEY, simhash INTEGER)""",
+    """CREATE TABLE IF NOT EXISTS fp_bands(
+        band INTEGER, key INTEGER, doc_id INTEGER,
+        PRIMARY KEY(band, key, doc_id)) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS near_dups(
+        url TEXT PRIMARY KEY, canonical_url TEXT, distance INTEGER, created_at TEXT)""",
+)
+
+def ensure(con):
+    for q in DDL: con.execute(q)
+    con.commit()
+
+def _signed(x: int) -> int:
+    # SQLite يخزن INTEGER بإشارة
+    return x - (1 << 64) if x >= (1 << 63) else x
+
+def _unsigned(x: int) -> int:
+    return x + (1 << 64) if x < 0 else x
+
+def simhash(text: str) -> int:
+    words = re.findall(r"\w+", (text or "").lower())
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    hs = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                   for s in shingles], dtype=np.uint64)
+    bits = ((hs[:, None] >> _SHIFTS) & np.uint64(1)).astype(np.int32)
+    v = (2 * bits - 1).sum(axis=0)
+    # int() قبل الإزاحة: 1 << np.int64(63) يفيض إلى بصمة سالبة فتفسد المسافات
+    return sum(1 << int(i) for i in np.nonzero(v > 0)[0])
+
+def bands(fp: int) -> List[Tuple[int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    return [(b, (fp >> (b * BAND_BITS)) & mask) for b in range(BANDS)]
+
+def distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def find(con, fp: int, max_distance: int = MAX_DISTANCE) -> Optional[Tuple[int, int]]:
+    """(doc_id, distance) لأقرب مستند مخزّن ضمن max_distance، أو None."""
+    where = " OR ".join("(b.band=? AND b.key=?)" for _ in range(BANDS))
+    args = [x for bk in bands(fp) for x in bk]
+    best = None
+    for doc_id, other in con.execute(
+            f"SELECT DISTINCT f.doc_id, f.simhash FROM fp_bands b "
+            f"JOIN doc_fingerprints f ON f.doc_id=b.doc_id WHERE {where}", args):
+        d = distance(fp, _unsigned(other))
+        if d <= max_distance and (best is None or d < best[1]):
+            best = (doc_id, d)
+    return best
+
+def record(cur, doc_id: int, fp: int):
+    cur.execute("INSERT OR REPLACE INTO doc_fingerprints(doc_id, simhash) VALUES(?,?)", (doc_id, _signed(fp)))
+    cur.executemany("INSERT OR IGNORE INTO fp_bands(band, key, doc_id) VALUES(?,?,?)",
+                    [(b, k, doc_id) for b, k in bands(fp)])
+
+def forget(cur, doc_ids: List[int]):
+    """احذف بصمات مستندات محذوفة حتى لا يطابقها إدخال جديد."""
+    for doc_id, fp in cur.execute(f"SELECT doc_id, simhash FROM doc_fingerprints WHERE doc_id IN "
+                                  f"({','.join('?' * len(doc_ids))})", doc_ids).fetchall():
+        cur.executemany("DELETE FROM fp_bands WHERE band=? AND key=? AND doc_id=?",
+                        [(b, k, doc_id) for b, k in bands(_unsigned(fp))])
+        cur.execute("DELETE FROM doc_fingerprints WHERE doc_id=?", (doc_id,))
+
+def link(cur, url: str, canonical_url: str, dist: int):
+    cur.execute("INSERT OR REPLACE INTO near_dups(url, canonical_url, distance, created_at) VALUES(?,?,?,?)",
+                (url, canonical_url, dist, dt.datetime.utcnow().isoformat()))
+
+class Deduper:
+    """فحص قبل التقطيع والترميز: يرجع الرابط الأصلي إن كان النص شبه مكرر، مع تذكّر
+    مستندات الدورة الحالية التي لم تُكتب بعد (قصص متزامنة من خلاصات مختلفة)."""
+    def __init__(self, db_path: str, max_distance: int = MAX_DISTANCE):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self._pending: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+
+    def _match(self, con, url: str, fp: int) -> Optional[Tuple[str, int]]:
+        hit = find(con, fp, self.max_distance)
+        if hit:
+            row = con.execute("SELECT url FROM docs WHERE id=?", (hit[0],)).fetchone()
+            if row and row[0] != url: return row[0], hit[1]
+        for bk in bands(fp):
+            for other, other_url in self._pending.get(bk, ()):
+                d = distance(fp, other)
+                if d <= self.max_distance and other_url != url:
+                    return other_url, d
+        return None
+
+    def check(self, url: str, text: str) -> Optional[Tuple[str, int]]:
+        """(الرابط الأصلي، المسافة) إن كان النص شبه مكرر — ويُسجَّل الربط في near_dups."""
+        con = db.connect(self.db_path)
+        fp = simhash(text)
+        hit = self._match(con, url, fp)
+        if hit:
+            with con: link(con.cursor(), url, *hit)
+            return hit
+        for bk in bands(fp):
+            self._pending.setdefault(bk, []).append((fp, url))
+        return None
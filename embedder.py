@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# خدمة ترميز مشتركة لكل العملية: نموذج واحد في الذاكرة، وطلبات الترميز المتزامنة
+# (من واجهات الويب وعمّال الإدخال) تُجمع في دفعات حسب max_batch و max_wait_ms.
+import os, time, queue, threading, numpy as np
+from concurrent.futures import Future
+from typing import Dict, List, Union
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+class EmbeddingService:
+    def __init__(self, model_name: str = MODEL_NAME, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._q: "queue.Queue" = queue.Queue()
+        self._model = None
+        self._lock = threading.Lock()
+        self._worker = None
+        self._c = {"requests": 0, "sentences": 0, "batches": 0, "errors": 0, "busy_s": 0.0}
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedder", daemon=True)
+                self._worker.start()
+
+    def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """متجهات float32 مُطبّعة؛ يحجب حتى تُرمَّز الدفعة التي ضُمّ إليها الطلب."""
+        if isinstance(texts, str): texts = [texts]
+        texts = list(texts)
+        if not texts: return np.zeros((0, 384), dtype=np.float32)
+        self._ensure_worker()
+        fut: Future = Future()
+        self._q.put((texts, fut))
+        return fut.result()
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            n = len(batch[0][0]); deadline = time.monotonic() + self.max_wait
+            # اجمع ما يصل خلال نافذة الانتظار حتى يمتلئ حجم الدفعة
+            while n < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0: break
+                try: item = self._q.get(timeout=left)
+                except queue.Empty: break
+                batch.append(item); n += len(item[0])
+            flat = [t for texts, _ in batch for t in texts]
+            t0 = time.perf_counter()
+            try:
+                embs = self.model.encode(flat, batch_size=self.max_batch, normalize_embeddings=True,
+                                         convert_to_numpy=True).astype(np.float32)
+            except Exception as e:
+                self._c["errors"] += 1
+                for _, fut in batch: fut.set_exception(e)
+                continue
+            self._c["busy_s"] += time.perf_counter() - t0
+            self._c["requests"] += len(batch); self._c["sentences"] += len(flat); self._c["batches"] += 1
+            i = 0
+            for texts, fut in batch:
+                fut.set_result(embs[i:i + len(texts)]); i += len(texts)
+
+    def stats(self) -> Dict:
+        c = dict(self._c)
+        return {"model": self.model_name, "model_loaded": self._model is not None,
+                "queue_depth": self._q.qsize(), "requests": c["requests"], "sentences": c["sentences"],
+                "batches": c["batches"], "errors": c["errors"],
+                "avg_batch": round(c["sentences"] / c["batches"], 2) if c["batches"] else 0,
+                "sentences_per_sec": round(c["sentences"] / c["busy_s"], 1) if c["busy_s"] else 0}
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_embedder() -> EmbeddingService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService(
+                model_name=os.getenv("AUTOLEARN_EMBED_MODEL", MODEL_NAME),
+                max_batch=int(os.getenv("AUTOLEARN_EMBED_MAX_BATCH", "64")),
+                max_wait_ms=float(os.getenv("AUTOLEARN_EMBED_MAX_WAIT_MS", "5")))
+    return _service
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# استخراج نص الصفحات في مرور واحد:
+#   1) جلب متدفق بحد أقصى للبايتات (safety.max_page_bytes) — الصفحة الضخمة تُقطع ولا تُحمَّل كاملة
+#   2) فك الترميز مرة واحدة (charset من الترويسة أو <meta>، وإلا utf-8)
+#   3) تحليل lxml مرة واحدة، ثم حذف الضجيج واختيار المحتوى الرئيسي (تقييم فقرات على
+#      طريقة readability) وتسطيح النص — كلها على الشجرة نفسها دون إعادة تسلسل وتحليل.
+import os, re, time
+from typing import List, NamedTuple, Optional, Tuple
+import lxml.html
+from lxml import etree
+import tracing, http_client
+
+MAX_BYTES = int(os.getenv("AUTOLEARN_MAX_PAGE_BYTES", "2000000"))
+HEADERS = {"User-Agent": http_client.USER_AGENT}
+
+_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+_XML_DECL = re.compile(r"^\s*<\?xml[^>]*\?>")
+_JUNK = ("script", "style", "noscript", "iframe", "form", "nav", "header", "footer", "aside", "svg",
+         "button", "template", "select", "textarea", "object", "embed", "canvas")
+_UNLIKELY = re.compile(r"comment|footer|sidebar|menu|\bnav|share|social|advert|\bads?\b|promo|related|cookie|"
+                       r"banner|popup|subscribe|newsletter|breadcrumb|pagination|widget|sponsor", re.I)
+_LIKELY = re.compile(r"article|body|content|entry|main|post|story|text|blog", re.I)
+_BLOCK = {"p", "div", "section", "article", "main", "li", "ul", "ol", "pre", "blockquote", "td", "tr", "table",
+          "h1", "h2", "h3", "h4", "h5", "h6", "br", "dd", "dt", "figcaption", "hr"}
+_SCORED = ("p", "pre", "td", "blockquote", "li")
+_TAG_BONUS = {"article": 10, "main": 10, "div": 5, "section": 3, "blockquote": 3, "pre": 3, "td": 3,
+              "ol": -3, "ul": -3, "li": -3, "form": -3, "th": -5, "h1": -5, "h2": -5, "h3": -5}
+_WS = re.compile(r"[ \t\r\f\v ]+")
+
+class Page(NamedTuple):
+    url: str
+    status: int
+    headers: dict
+    content: bytes
+    truncated: bool
+    charset: Optional[str]
+
+# ---------- الجلب وفك الترميز ----------
+def _chunks(r, deadline: Optional[float]):
+    # read1 يعيد ما وصل دون انتظار امتلاء الكتلة، فيُفحص الموعد النهائي حتى مع خادم يقطّر البايتات
+    if deadline and hasattr(r.raw, "read1"):
+        while True:
+            part = r.raw.read1(65536, decode_content=True)
+            if not part: return
+            yield part
+    else:
+        yield from r.iter_content(65536)
+
+def fetch(url: str, timeout: float = 12, max_bytes: int = MAX_BYTES, headers: dict = None,
+          session=None, deadline: Optional[float] = None) -> Page:
+    """GET متدفق يتوقف عند max_bytes، أو عند deadline (time.monotonic) لخادم يقطّر البايتات.
+    يرفع الاستثناء لحالات ≥ 400 (304 تُعاد كما هي).
+    الافتراضي هو العميل المشترك (اتصالات دائمة + حد معدل لكل نطاق + robots.txt)."""
+    r = (session or http_client.get_client()).get(url, timeout=timeout, headers={**HEADERS, **(headers or {})}, stream=True)
+    try:
+        r.raise_for_status()
+        buf, truncated = bytearray(), False
+        if r.status_code != 304:
+            for part in _chunks(r, deadline):
+                buf += part
+                if len(buf) >= max_bytes:
+                    del buf[max_bytes:]; truncated = True; break
+                if deadline and time.monotonic() >= deadline:
+                    truncated = True; break
+        ctype = r.headers.get("Content-Type", "")
+        m = re.search(r"charset=([\w-]+)", ctype, re.I)
+        return Page(r.url, r.status_code, dict(r.headers), bytes(buf), truncated, m and m.group(1))
+    finally:
+        r.close()
+
+def decode(content: bytes, charset: Optional[str] = None) -> str:
+    if not charset:
+        m = _CHARSET.search(content[:4096])
+        charset = m and m.group(1).decode("ascii", "ignore")
+    for cs in (charset, "utf-8"):
+        if not cs: continue
+        try: return content.decode(cs)
+        except (LookupError, UnicodeDecodeError): pass
+    return content.decode("utf-8", errors="replace")
+
+def page_text(page: Page) -> str:
+    return decode(page.content, page.charset)
+
+# ---------- التحليل واختيار المحتوى ----------
+def parse(html: str):
+    html = _XML_DECL.sub("", html or "", count=1)
+    if not html.strip(): return None
+    try:
+        return lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return None
+
+def _text_len(el) -> int:
+    return len(" ".join("".join(el.itertext()).split()))
+
+def _link_density(el, n: int) -> float:
+    if not n: return 0.0
+    return sum(_text_len(a) for a in el.iter("a")) / n
+
+def title_of(root) -> str:
+    for path in ('//meta[@property="og:title"]/@content', "//title/text()", "//h1//text()"):
+        got = [t.strip() for t in root.xpath(path) if t and t.strip()]
+        if got:
+            t = " ".join(got[0].split())
+            # "العنوان | الموقع" → الجزء الأطول
+            parts = [p.strip() for p in re.split(r"\s[|\-–—»:]\s", t) if p.strip()]
+            best = max(parts, key=len) if parts else t
+            return best if len(best.split()) >= 2 else t
+    return ""
+
+def _strip_noise(root):
+    etree.strip_elements(root, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+    for el in list(root.iter(*_JUNK)):
+        el.drop_tree()
+    for el in list(root.iter(etree.Element)):
+        if el.getparent() is None or el.tag in ("html", "body"): continue
+        cls = f"{el.get('class', '')} {el.get('id', '')}"
+        style = el.get("style", "")
+        if (el.get("hidden") is not None or re.search(r"display\s*:\s*none", style)
+                or (cls.strip() and _UNLIKELY.search(cls) and not _LIKELY.search(cls))):
+            el.drop_tree()
+
+def _class_weight(el) -> int:
+    cls = f"{el.get('class', '')} {el.get('id', '')}"
+    return (25 if _LIKELY.search(cls) else 0) - (25 if _UNLIKELY.search(cls) else 0)
+
+def main_content(root) -> List:
+    """عناصر المحتوى الرئيسي: أعلى عقدة تقييمًا مع أشقائها ذوي الصلة."""
+    body = root.find("body")
+    body = root if body is None else body
+    scores = {}
+    for el in body.iter(*_SCORED):
+        n = _text_len(el)
+        if n < 25: continue
+        txt = el.text_content()
+        s = 1 + txt.count(",") + txt.count("،") + min(n // 100, 3)
+        # الفقرة ترفع رصيد أبيها كاملًا وجدّها بالنصف
+        parent = el.getparent(); share = 1.0
+        while parent is not None and share >= 0.5:
+            if parent not in scores:
+                scores[parent] = _TAG_BONUS.get(parent.tag, 0) + _class_weight(parent)
+            scores[parent] += s * share
+            parent, share = parent.getparent(), share / 2
+    if not scores: return [body]
+    ranked = {el: sc * (1 - _link_density(el, _text_len(el))) for el, sc in scores.items()}
+    best = max(ranked, key=ranked.get)
+    parent = best.getparent()
+    if parent is None: return [best]
+    threshold = max(10.0, ranked[best] * 0.2)
+    keep = []
+    for sib in parent:
+        if not isinstance(sib.tag, str): continue
+        if sib is best or ranked.get(sib, 0) >= threshold:
+            keep.append(sib)
+        elif sib.tag == "p":
+            n = _text_len(sib)
+            if n > 80 and _link_density(sib, n) < 0.25: keep.append(sib)
+    return keep
+
+def flatten(elements) -> str:
+    """نص العناصر مع فاصل سطر بين الكتل ومسافات مطبّعة داخلها."""
+    out: List[str] = []
+    def walk(el):
+        if not isinstance(el.tag, str):
+            if el.tail: out.append(el.tail)
+            return
+        block = el.tag in _BLOCK
+        if block: out.append("\n")
+        if el.text: out.append(el.text)
+        for ch in el: walk(ch)
+        if block: out.append("\n")
+        if el.tail: out.append(el.tail)
+    for el in elements:
+        tail, el.tail = el.tail, None  # ذيل العنصر خارج المحتوى المختار
+        walk(el); el.tail = tail
+    lines = (_WS.sub(" ", ln).strip() for ln in "".join(out).split("\n"))
+    return "\n".join(ln for ln in lines if ln)
+
+def extract(html: str) -> Tuple[str, str]:
+    """(العنوان، النص الرئيسي) بتحليل واحد؛ ("", "") إن تعذّر التحليل."""
+    with tracing.span("extract.parse"):
+        root = parse(html)
+    if root is None: return "", ""
+    with tracing.span("extract.content"):
+        title = title_of(root)
+        _strip_noise(root)
+        return title, flatten(main_content(root))
+
+def plain_text(html: str) -> str:
+    """كل نص الصفحة بعد حذف الضجيج (بلا اختيار محتوى رئيسي)."""
+    root = parse(html)
+    if root is None: return ""
+    _strip_noise(root)
+    body = root.find("body")
+    return flatten([root if body is None else body])
+
+def fetch_text(url: str, timeout: float = 12, max_bytes: int = MAX_BYTES, session=None,
+               deadline: Optional[float] = None) -> Tuple[str, str]:
+    with tracing.span("fetch.http"):
+        page = fetch(url, timeout, max_bytes, session=session, deadline=deadline)
+        html = page_text(page)
+    return extract(html)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# حالة الجلب لكل خلاصة/رابط: ETag و Last-Modified وبصمة المحتوى،
+# لنطلب الخلاصات شرطيًا (304) ونستبعد الروابط المعروفة قبل أي اتصال شبكي.
+import hashlib, datetime as dt
+from typing import Dict, Iterable, Optional, Set
+
+DDL = """CREATE TABLE IF NOT EXISTS fetch_state(
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    status INTEGER,
+    fetched_at TEXT
+)"""
+
+def ensure(con):
+    con.execute(DDL); con.commit()
+
+def content_hash(data) -> str:
+    if isinstance(data, str): data = data.encode("utf-8", "ignore")
+    return hashlib.sha1(data or b"").hexdigest()
+
+def get(con, url: str) -> Optional[Dict]:
+    row = con.execute("SELECT etag, last_modified, content_hash, status FROM fetch_state WHERE url=?",
+                      (url,)).fetchone()
+    if not row: return None
+    return {"etag": row[0], "last_modified": row[1], "content_hash": row[2], "status": row[3]}
+
+def update(con, url: str, etag: str = None, last_modified: str = None,
+           content_hash: str = None, status: int = 200):
+    with con:
+        con.execute("""INSERT INTO fetch_state(url,etag,last_modified,content_hash,status,fetched_at)
+                       VALUES(?,?,?,?,?,?)
+                       ON CONFLICT(url) DO UPDATE SET
+                         etag=COALESCE(excluded.etag, etag),
+                         last_modified=COALESCE(excluded.last_modified, last_modified),
+                         content_hash=COALESCE(excluded.content_hash, content_hash),
+                         status=excluded.status, fetched_at=excluded.fetched_at""",
+                    (url, etag, last_modified, content_hash, status, dt.datetime.utcnow().isoformat()))
+
+def conditional_headers(state: Optional[Dict]) -> Dict[str, str]:
+    h = {}
+    if state and state.get("etag"): h["If-None-Match"] = state["etag"]
+    if state and state.get("last_modified"): h["If-Modified-Since"] = state["last_modified"]
+    return h
+
+def known_urls(con, urls: Iterable[str], batch: int = 500) -> Set[str]:
+    """الروابط المخزّنة مسبقًا أو المجلوبة بنجاح، باستعلام واحد لكل 500 رابط."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    known: Set[str] = set()
+    for i in range(0, len(urls), batch):
+        part = urls[i:i + batch]
+        marks = ",".join("?" * len(part))
+        known.update(r[0] for r in con.execute(
+            f"SELECT url FROM docs WHERE url IN ({marks}) "
+            f"UNION SELECT url FROM fetch_state WHERE status=200 AND url IN ({marks})", part + part))
+    return known
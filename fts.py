@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# فهرس نصي FTS5 (BM25) على chunks، مُزامَن بالـtriggers.
+# الجدول بلا محتوى (content='') فلا يُكرر نص المقاطع؛ والتطبيع العربي (حذف التشكيل
+# والتطويل، توحيد الألف والياء والتاء المربوطة) يتم داخل SQL حتى تعمل الـtriggers من
+# أي اتصال أو عملية دون دوال بايثون مسجّلة. نص المقطع الذي يُفهرس هو مداه داخل
+# docs.text (انظر chunking)، لذا يجب حذف المقاطع قبل مستنداتها.
+import re
+from typing import List, Tuple
+from chunking import row_text_sql, text_sql, JOIN_DOCS
+
+_STRIP = [chr(c) for c in range(0x064B, 0x0653)] + ["ٰ", "ـ"]
+_MAP = {"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه"}
+_AR_PREFIX = "ال"
+
+def normalize(text: str) -> str:
+    for ch in _STRIP: text = text.replace(ch, "")
+    for a, b in _MAP.items(): text = text.replace(a, b)
+    return text
+
+def norm_sql(expr: str) -> str:
+    """نفس normalize() كتعبير SQL من replace() متداخلة."""
+    for ch in _STRIP: expr = f"replace({expr}, char({ord(ch)}), '')"
+    for a, b in _MAP.items(): expr = f"replace({expr}, char({ord(a)}), '{b}')"
+    return expr
+
+TRIGGERS = ("chunks_fts_ai", "chunks_fts_ad", "chunks_fts_au")
+
+def ddl(text_expr_new: str = row_text_sql("new"), text_expr_old: str = row_text_sql("old")) -> List[str]:
+    n_new, n_old = norm_sql(text_expr_new), norm_sql(text_expr_old)
+    return [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+            text, content='', tokenize='unicode61 remove_diacritics 2')""",
+        f"""CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+            INSERT INTO chunks_fts(rowid, text) VALUES (new.id, {n_new}); END""",
+        f"""CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, {n_old}); END""",
+        f"""CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE OF text, start, stop ON chunks BEGIN
+            INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, {n_old});
+            INSERT INTO chunks_fts(rowid, text) VALUES (new.id, {n_new}); END""",
+    ]
+
+def ensure(con):
+    fresh = con.execute("SELECT 1 FROM sqlite_master WHERE name='chunks_fts'").fetchone() is None
+    qs = ddl()
+    # triggers قديمة (قبل مقاطع المدى) تُستبدل بالنسخة الحالية
+    old = dict(con.execute(f"SELECT name, sql FROM sqlite_master WHERE type='trigger' "
+                           f"AND name IN ({','.join('?' * len(TRIGGERS))})", TRIGGERS).fetchall())
+    for name, q in zip(TRIGGERS, qs[1:]):
+        if name in old and old[name] != q.replace(" IF NOT EXISTS", ""):
+            con.execute(f"DROP TRIGGER {name}")
+    for q in qs: con.execute(q)
+    if fresh:
+        # فهرسة المقاطع الموجودة مرة واحدة
+        con.execute(f"INSERT INTO chunks_fts(rowid, text) SELECT c.id, {norm_sql(text_sql())} FROM {JOIN_DOCS} "
+                    f"WHERE {text_sql()} IS NOT NULL")
+    con.commit()
+
+def match_query(q: str) -> str:
+    # كل كلمة بادئة (prefix)، ونضيف صيغتها بلا "ال" التعريف؛ الربط بـ OR و BM25 يرتّب
+    terms = []
+    for w in re.findall(r"\w+", normalize(q.lower())):
+        if len(w) < 2: continue
+        terms.append(w)
+        if w.startswith(_AR_PREFIX) and len(w) > 4: terms.append(w[2:])
+    return " OR ".join(f'"{t}"*' for t in dict.fromkeys(terms))
+
+def search(con, q: str, limit: int = 50) -> List[Tuple[int, float]]:
+    """[(chunk_id, bm25)] — الأصغر أفضل كما في SQLite."""
+    mq = match_query(q)
+    if not mq: return []
+    try:
+        return con.execute("SELECT rowid, bm25(chunks_fts) AS s FROM chunks_fts WHERE chunks_fts MATCH ? "
+                           "ORDER BY s LIMIT ?", (mq, limit)).fetchall()
+    except Exception:
+        return []
+
+def rrf(*rankings: List[int], k: int = 60) -> List[Tuple[int, float]]:
+    """دمج قوائم مرتبة بـ Reciprocal Rank Fusion."""
+    scores = {}
+    for ranking in rankings:
+        for r, cid in enumerate(ranking):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + r + 1)
+    return sorted(scores.items(), key=lambda x: -x[1])
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# طبقة HTTP مشتركة لكل الجلب (news_worker / fetcher / qa):
+#   - Session واحدة بمجمّعات اتصال keep-alive لكل مضيف (لا مصافحة TCP+TLS لكل مقال)
+#   - دلو رموز لكل نطاق: معدل ثابت مع دفعة صغيرة، فلا يُغرق الزاحف الموسّع مضيفًا واحدًا
+#   - robots.txt يُجلب مرة لكل مضيف ويُخزَّن في القاعدة مع TTL (safety.respect_robots_txt)
+import os, time, threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import requests
+from requests.adapters import HTTPAdapter
+import db
+
+HOST_RATE = float(os.getenv("AUTOLEARN_HOST_RATE", "2"))       # طلب/ثانية لكل نطاق
+HOST_BURST = float(os.getenv("AUTOLEARN_HOST_BURST", "4"))
+ROBOTS_TTL = float(os.getenv("AUTOLEARN_ROBOTS_TTL", "86400"))
+# robots.txt غير متاح (5xx/شبكة) خطأ عابر: نعيد المحاولة بعد دقائق، لا بعد ساعة
+ROBOTS_ERROR_TTL = float(os.getenv("AUTOLEARN_ROBOTS_ERROR_TTL", "300"))
+POOL_SIZE = 16
+USER_AGENT = "Mozilla/5.0 (AutoLearn/1.0)"
+
+DDL = """CREATE TABLE IF NOT EXISTS robots_cache(
+    host TEXT PRIMARY KEY,
+    status INTEGER,
+    body TEXT,
+    fetched_at REAL
+)"""
+
+class RobotsDisallowed(requests.RequestException):
+    pass
+
+def ensure(con):
+    con.execute(DDL); con.commit()
+
+class TokenBucket:
+    """دلو رموز لكل مضيف؛ acquire ينتظر حتى يتوفر رمز."""
+    def __init__(self, rate: float = HOST_RATE, burst: float = HOST_BURST):
+        self.rate, self.burst = rate, max(1.0, burst)
+        self._lock = threading.Lock()
+        self._state: Dict[str, list] = {}  # host → [tokens, last, rate]
+
+    def set_rate(self, host: str, rate: float):
+        with self._lock:
+            self._state.setdefault(host, [self.burst, time.monotonic(), self.rate])[2] = rate
+
+    def acquire(self, host: str) -> float:
+        """يحجز رمزًا ويعيد زمن الانتظار بالثواني."""
+        if self.rate <= 0: return 0.0
+        with self._lock:
+            now = time.monotonic()
+            st = self._state.setdefault(host, [self.burst, now, self.rate])
+            st[0] = min(self.burst, st[0] + (now - st[1]) * st[2]); st[1] = now
+            # نحجز الرمز الآن (قد يصبح الرصيد سالبًا) وننتظر خارج القفل
+            st[0] -= 1
+            delay = -st[0] / st[2] if st[0] < 0 else 0.0
+        if delay: time.sleep(delay)
+        return delay
+
+class Robots:
+    """قواعد robots.txt لكل مضيف: ذاكرة العملية ثم جدول robots_cache ثم الشبكة."""
+    def __init__(self, client: "Client", db_path: Optional[str], ttl: float = ROBOTS_TTL):
+        self.client, self.db_path, self.ttl = client, db_path, ttl
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, tuple] = {}  # origin → (parser, expires)
+        self._host_locks: Dict[str, threading.Lock] = {}
+        if db_path: ensure(db.connect(db_path))
+
+    @staticmethod
+    def _parse(status: int, body: str) -> RobotFileParser:
+        rp = RobotFileParser()
+        if status >= 500: rp.disallow_all = True   # لا قواعد معروفة بعد: نمتنع حتى إعادة المحاولة القريبة
+        elif status >= 400: rp.allow_all = True    # لا يوجد robots.txt
+        else: rp.parse(body.splitlines())
+        rp.modified()
+        return rp
+
+    def _load(self, origin: str):
+        now = time.time()
+        row = None
+        if self.db_path:
+            row = db.connect(self.db_path).execute(
+                "SELECT status, body, fetched_at FROM robots_cache WHERE host=?", (origin,)).fetchone()
+        if row is None or now - row[2] > (self.ttl if row[0] < 500 else ROBOTS_ERROR_TTL):
+            try:
+                r = self.client.session.get(origin + "/robots.txt", timeout=10, headers={"User-Agent": USER_AGENT})
+                fresh = (r.status_code, r.text[:500000] if r.status_code < 400 else "", now)
+            except requests.RequestException:
+                fresh = (599, "", now)
+            if fresh[0] >= 500 and row is not None and row[0] < 500:
+                # عطل عابر: آخر قواعد صالحة تبقى سارية، ونعيد الجلب بعد ROBOTS_ERROR_TTL
+                return self._parse(row[0], row[1]), now + ROBOTS_ERROR_TTL
+            row = fresh
+            if self.db_path:
+                con = db.connect(self.db_path)
+                with con:
+                    con.execute("INSERT OR REPLACE INTO robots_cache(host, status, body, fetched_at) VALUES(?,?,?,?)",
+                                (origin, *row))
+        status, body, fetched_at = row
+        return self._parse(status, body), fetched_at + (self.ttl if status < 500 else ROBOTS_ERROR_TTL)
+
+    def rules(self, url: str) -> RobotFileParser:
+        p = urlparse(url)
+        origin = f"{p.scheme}://{p.netloc}"
+        with self._lock:
+            got = self._hosts.get(origin)
+            if got and got[1] > time.time(): return got[0]
+            lock = self._host_locks.setdefault(origin, threading.Lock())
+        with lock:  # طلب robots.txt واحد لكل مضيف حتى مع تزامن الخيوط
+            got = self._hosts.get(origin)
+            if got and got[1] > time.time(): return got[0]
+            rp, expires = self._load(origin)
+            delay = rp.crawl_delay(USER_AGENT)
+            if delay: self.client.bucket.set_rate(p.hostname or "", min(self.client.bucket.rate, 1.0 / float(delay)))
+            with self._lock:
+                self._hosts[origin] = (rp, expires)
+            return rp
+
+    def allowed(self, url: str) -> bool:
+        return self.rules(url).can_fetch(USER_AGENT, url)
+
+class Client:
+    """واجهة متوافقة مع requests.get: client.get(url, timeout=..., headers=..., stream=...)."""
+    def __init__(self, db_path: Optional[str] = None, rate: float = HOST_RATE, burst: float = HOST_BURST,
+                 respect_robots: bool = False, pool_size: int = POOL_SIZE):
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount("http://", adapter); self.session.mount("https://", adapter)
+        self.bucket = TokenBucket(rate, burst)
+        self.robots = Robots(self, db_path) if respect_robots else None
+        self.settings = (db_path, dict(rate=rate, burst=burst, respect_robots=respect_robots, pool_size=pool_size))
+
+    def get(self, url: str, robots: bool = True, **kw) -> requests.Response:
+        """robots=False لواجهات برمجية موثّقة يحكمها سياسة استخدامها لا robots.txt (انظر
+        news_worker.search_wikipedia)؛ حد المعدل لكل نطاق يبقى ساريًا."""
+        if robots and self.robots is not None and not self.robots.allowed(url):
+            raise RobotsDisallowed(f"robots.txt disallows {url}")
+        self.bucket.acquire(urlparse(url).hostname or "")
+        kw.setdefault("timeout", 12)
+        return self.session.get(url, **kw)
+
+    def close(self):
+        self.session.close()
+
+_client: Optional[Client] = None
+_client_lock = threading.Lock()
+
+def configure(cfg: Dict = None, db_path: Optional[str] = None) -> Client:
+    """يبني العميل المشترك من الإعدادات (crawl.host_rate / host_burst، safety.respect_robots_txt).
+    إعدادات لم تتغير تُبقي العميل الحالي: اتصالاته الدافئة ودلاء الرموز وقواعد robots."""
+    global _client
+    c = (cfg or {}).get("crawl", {}) or {}
+    safety = (cfg or {}).get("safety", {}) or {}
+    kw = dict(rate=float(c.get("host_rate", HOST_RATE)), burst=float(c.get("host_burst", HOST_BURST)),
+              respect_robots=bool(safety.get("respect_robots_txt",
+                                             os.getenv("AUTOLEARN_RESPECT_ROBOTS", "0") == "1")),
+              pool_size=max(POOL_SIZE, int(c.get("concurrency", 8))))
+    with _client_lock:
+        if _client is not None and _client.settings == (db_path, kw): return _client
+    client = Client(db_path, **kw)
+    with _client_lock:
+        old, _client = _client, client
+    if old is not None: old.close()
+    return client
+
+def get_client() -> Client:
+    with _client_lock:
+        if _client is not None: return _client
+    return configure(db_path=os.getenv("AUTOLEARN_DB") if os.getenv("AUTOLEARN_RESPECT_ROBOTS") == "1" else None)
@@ -1,44 +1,52 @@
 # -*- coding: utf-8 -*-
-import numpy as np, re
-from typing import List, Dict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Tuple
+import tfidf, chunking, tracing
 from memory import Memory
+from embedder import get_embedder
 
 class Learner:
     def __init__(self, mem: Memory):
         self.mem = mem
-        self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        self.embedder = get_embedder()
 
-    def _chunk(self, text: str, size: int = 800, overlap: int = 120) -> List[str]:
-        words = re.split(r"\s+", text)
-        i, out = 0, []
-        while i < len(words):
-            out.append(" ".join(words[i:i+size]))
-            i += (size - overlap)
-        return [c for c in out if len(c.split()) > 30]
+    def _chunk(self, text: str, size: int = 5000, overlap: int = 750) -> List[Tuple[int, int]]:
+        # ~800 كلمة مع تداخل ~120، كمواضع داخل نص المستند
+        return list(chunking.spans(text, size, overlap, min_words=30))
 
     def process_doc(self, doc_id: int, text: str):
-        chunks = self._chunk(text)
-        if not chunks: return
-        embeds = self.model.encode(chunks, normalize_embeddings=True)
-        for ch, emb in zip(chunks, embeds):
-            self.mem.add_chunk(doc_id, ch, emb.astype(np.float32).tobytes())
-        # insight بسيط: أهم الجُمل TF-IDF
-        top = self.top_sentences(text, k=3)
-        for s in top:
-            self.mem.add_insight(doc_id, s)
+        self.process_docs([(doc_id, text)])
+
+    def process_docs(self, docs: List[Tuple[int, str]]):
+        """دفعة مستندات: ترميز كل مقاطعها معًا واستخراج insights في تحويل TF-IDF واحد.
+        المدى يُحسب على docs.text المخزّن لا على النص المُمرَّر: add_doc قد يعيد معرّف أصلٍ
+        شبه مكرر نصه مختلف، وما له مقاطع سابقًا يُتخطى."""
+        stored = [(doc_id, self.mem.unchunked_text(doc_id)) for doc_id, _ in docs]
+        docs = [(doc_id, text) for doc_id, text in stored if text]
+        with tracing.span("chunk"):
+            chunked = [(doc_id, self._chunk(text)) for doc_id, text in docs]
+            # النصوص تُجسَّد للترميز فقط؛ المخزَّن هو المدى
+            flat = [c for (_, cs), (_, text) in zip(chunked, docs) for c in chunking.materialize(text, cs)]
+        if not flat: return
+        with tracing.span("embed"):
+            embeds = self.embedder.encode(flat)
+        # insight بسيط: أهم الجُمل TF-IDF (IDF المدونة)
+        with tracing.span("insights"):
+            tops = self.top_sentences_many([text for _, text in docs], k=3)
+        i = 0
+        with tracing.span("store"):
+            for (doc_id, chunks), top in zip(chunked, tops):
+                if chunks: self.mem.add_chunks(doc_id, chunks, embeds[i:i + len(chunks)], top)
+                i += len(chunks)
+
+    def top_sentences_many(self, texts: List[str], k: int = 3) -> List[List[str]]:
+        return tfidf.top_sentences(self.mem._con(), texts, k)
 
     def top_sentences(self, text: str, k: int = 3) -> List[str]:
-        sents = re.split(r"(?<=[.!؟])\s+", text)
-        vec = TfidfVectorizer(max_features=2000).fit_transform(sents)
-        scores = vec.sum(axis=1).A.ravel()
-        idx = np.argsort(scores)[::-1][:k]
-        return [sents[i] for i in idx if sents[i].strip()]
+        return self.top_sentences_many([text], k)[0]
 
     def answer_from_chunks(self, question: str, hits: List[Dict]) -> str:
         if not hits: return "لم أعثر على إجابة كافية بعد."
         context = "\n\n".join([h["text"] for h in hits])
         # إجابة توليدية مبسّطة بدون LLM:
-        return f"مختصر الإجابة:\n{self.top_sentences(context, k=2)[0]}\n\n— (اعتمدت على {len(hits)} مقطع من الذاكرة)"
+        top = self.top_sentences(context, k=2) or [hits[0]["text"]]
+        return f"مختصر الإجابة:\n{top[0]}\n\n— (اعتمدت على {len(hits)} مقطع من الذاكرة)"
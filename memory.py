@@ -1,74 +1,251 @@
 # -*- coding: utf-8 -*-
-import os, sqlite3, hashlib, numpy as np
-from typing import List, Dict
-from sklearn.metrics.pairwise import cosine_similarity
+import os, time, hashlib, threading, datetime as dt, numpy as np
+from typing import List, Dict, Tuple
+import db, schema, fetch_state, dedup, fts, answer_cache, quant, tfidf, chunking, counters, tracing
+from vector_index import VectorIndex
+from embedder import get_embedder
 
 class Memory:
-    def __init__(self, db_path: str = "autolearn.db"):
-        import os
-self.db_path = db_path or os.getenv("AUTOLEARN_DB", "/data/autolearn.db")
+    def __init__(self, db_path: str = "autolearn.db", readonly: bool = False, cache_path: str = None):
+        self.db_path = db_path or os.getenv("AUTOLEARN_DB", "/data/autolearn.db")
+        # readonly: شظية مختومة (shards.py) — بحث فقط، بلا ترحيل ولا كتابة متجهات
+        self.readonly = readonly
+        # قاعدة answer_cache: هذه القاعدة، أو الأساسية عندما تكون هذه شظية
+        self.cache_path = cache_path or self.db_path
+        self.index = VectorIndex(self.db_path)
+        self.latency = counters.LatencyRecorder(self.db_path)
+
+    def _con(self):
+        return db.connect(self.db_path, readonly=self.readonly)
+
+    def _sync(self, con):
+        if not self.readonly: self.index.sync(con)
 
     def init(self):
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        cur.execute("""CREATE TABLE IF NOT EXISTS docs(
-            id INTEGER PRIMARY KEY, url TEXT UNIQUE, title TEXT, text TEXT,
-            source TEXT, lang TEXT, h TEXT)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS chunks(
-            id INTEGER PRIMARY KEY, doc_id INTEGER, text TEXT, emb BLOB)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS insights(
-            id INTEGER PRIMARY KEY, doc_id INTEGER, text TEXT)""")
-        con.commit(); con.close()
+        # المخطط الموحّد نفسه الذي يستعمله news_worker (مع ترحيل القواعد القديمة)
+        if not self.readonly: schema.ensure(self._con())
 
     def _hash(self, s: str) -> str: return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
     def doc_exists(self, url: str) -> bool:
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        cur.execute("SELECT 1 FROM docs WHERE url=? LIMIT 1", (url,))
-        ok = cur.fetchone() is not None; con.close(); return ok
-
-    def add_doc(self, url: str, title: str, text: str, source: str, lang: str) -> int:
-        h = self._hash(url)
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        cur.execute("INSERT OR IGNORE INTO docs(url,title,text,source,lang,h) VALUES(?,?,?,?,?,?)",
-                    (url, title, text, source, lang, h))
-        con.commit()
+        cur = self._con().execute("SELECT 1 FROM docs WHERE url=? LIMIT 1", (url,))
+        return cur.fetchone() is not None
+
+    def doc_id(self, url: str):
+        row = self._con().execute("SELECT id FROM docs WHERE url=?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def known_urls(self, urls: List[str]) -> set:
+        """فلترة دفعة روابط قبل الجلب: ما خُزّن أو جُلب سابقًا."""
+        return fetch_state.known_urls(self._con(), urls)
+
+    def find_near_duplicate(self, text: str):
+        """(doc_id, distance) لمستند مخزّن شبه مطابق — استدعها قبل التقطيع والترميز."""
+        return dedup.find(self._con(), dedup.simhash(text))
+
+    def unchunked_text(self, doc_id: int):
+        """نص المستند المخزّن إن لم تكن له مقاطع بعد، وإلا None (مُقطَّع سابقًا أو بارد)."""
+        row = self._con().execute("SELECT text FROM docs d WHERE id=? AND NOT EXISTS "
+                                  "(SELECT 1 FROM chunks c WHERE c.doc_id=d.id)", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def _insert_doc(self, cur, url, title, text, source, lang):
+        cur.execute("INSERT OR IGNORE INTO docs(url,title,text,source,lang,h,created_at) VALUES(?,?,?,?,?,?,?)",
+                    (url, title, text, source, lang, self._hash(url), dt.datetime.utcnow().isoformat()))
+        created = cur.rowcount > 0
+        if created: tfidf.record(cur, [text])
         cur.execute("SELECT id FROM docs WHERE url=?", (url,))
-        doc_id = cur.fetchone()[0]; con.close(); return doc_id
+        return cur.fetchone()[0], created
+
+    def _near_duplicate(self, cur, url: str, fp: int):
+        # الرابط الموجود يُعاد كما هو؛ النص شبه المكرر يُربط بأصله في near_dups
+        hit = None if self.doc_exists(url) else dedup.find(cur, fp)
+        if hit:
+            canonical = cur.execute("SELECT url FROM docs WHERE id=?", (hit[0],)).fetchone()[0]
+            dedup.link(cur, url, canonical, hit[1])
+        return hit
+
+    def _invalidate(self, cur, topic: str):
+        # في القاعدة نفسها: ضمن معاملة الإدخال؛ وإلا تُعاد الكلمات لتُسقط بعد الالتزام (_drop_answers)
+        if self.cache_path == self.db_path:
+            answer_cache.invalidate_topic(cur, topic); return []
+        return answer_cache.informative(cur, answer_cache.terms(topic))
+
+    def _drop_answers(self, ts: List[str]):
+        if not ts or not os.path.exists(self.cache_path): return
+        con = db.connect(self.cache_path)
+        with con: answer_cache.invalidate_terms(con.cursor(), ts)
+
+    def add_doc(self, url: str, title: str, text: str, source: str, lang: str) -> Tuple[int, bool]:
+        """المستند وحده (المقاطع لاحقًا عبر add_chunks) ← (doc_id, is_new).
+        الرابط الموجود أو النص شبه المكرر يعيد معرّف الأصل مع is_new=False."""
+        con = self._con()
+        fp = dedup.simhash(text)
+        with con:
+            cur = con.cursor()
+            hit = self._near_duplicate(cur, url, fp)
+            if hit: return hit[0], False
+            doc_id, created = self._insert_doc(cur, url, title, text, source, lang)
+            stale = []
+            if created:
+                dedup.record(cur, doc_id, fp)
+                stale = self._invalidate(cur, f"{title} {text[:300]}")
+        self._drop_answers(stale)
+        return doc_id, created
 
     def add_chunk(self, doc_id: int, text: str, emb_bytes: bytes):
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        cur.execute("INSERT INTO chunks(doc_id,text,emb) VALUES(?,?,?)", (doc_id, text, emb_bytes))
-        con.commit(); con.close()
+        con = self._con()
+        with con:
+            con.execute("INSERT INTO chunks(doc_id,chunk_index,text,emb) "
+                        "VALUES(?,(SELECT COUNT(*) FROM chunks WHERE doc_id=?),?,?)", (doc_id, doc_id, text, emb_bytes))
+        self.index.sync(con)
 
     def add_insight(self, doc_id: int, text: str):
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        cur.execute("INSERT INTO insights(doc_id,text) VALUES(?,?)", (doc_id, text))
-        con.commit(); con.close()
+        con = self._con()
+        with con:
+            con.execute("INSERT INTO insights(doc_id,text,created_at) VALUES(?,?,?)",
+                        (doc_id, text, dt.datetime.utcnow().isoformat()))
+
+    def _insert_chunks(self, cur, doc_id, chunks, embs, insights):
+        # المقطع مدى (start, stop) داخل docs.text، أو نص صريح (واجهة قديمة)
+        embs = [None] * len(chunks) if embs is None else embs
+        base = cur.execute("SELECT COUNT(*) FROM chunks WHERE doc_id=?", (doc_id,)).fetchone()[0]
+        cur.executemany("INSERT INTO chunks(doc_id,chunk_index,text,start,stop,emb) VALUES(?,?,?,?,?,?)",
+                        [(doc_id, base + i, *((ch, None, None) if isinstance(ch, str) else (None, *ch)),
+                          None if e is None else quant.encode(e)) for i, (ch, e) in enumerate(zip(chunks, embs))])
+        now = dt.datetime.utcnow().isoformat()
+        cur.executemany("INSERT INTO insights(doc_id,text,created_at) VALUES(?,?,?)",
+                        [(doc_id, s, now) for s in insights or []])
+
+    def add_chunks(self, doc_id: int, chunks: List, embs=None, insights: List[str] = None):
+        """كل مقاطع مستند ومتجهاتها ومعارفه في معاملة واحدة."""
+        con = self._con()
+        with con:
+            self._insert_chunks(con.cursor(), doc_id, chunks, embs, insights)
+        self.index.sync(con)
+
+    def add_document_with_chunks(self, url: str, title: str, text: str, source: str, lang: str,
+                                 chunks: List, embs=None, insights: List[str] = None) -> Tuple[int, bool]:
+        """المستند + مقاطعه + متجهاتها + معارفه في معاملة واحدة (executemany) ← (doc_id, is_new).
+        إن كان الرابط موجودًا مسبقًا، أو النص شبه مكرر لمستند آخر، يُعاد معرّف
+        المستند الأصلي مع is_new=False دون تكرار المقاطع."""
+        con = self._con()
+        fp = dedup.simhash(text)
+        with con:
+            cur = con.cursor()
+            hit = self._near_duplicate(cur, url, fp)
+            if hit: return hit[0], False
+            doc_id, created = self._insert_doc(cur, url, title, text, source, lang)
+            stale = []
+            if created:
+                self._insert_chunks(cur, doc_id, chunks, embs, insights)
+                dedup.record(cur, doc_id, fp)
+                stale = self._invalidate(cur, f"{title} {text[:300]}")
+        self._drop_answers(stale)
+        if created and embs is not None:
+            self.index.sync(con)
+        return doc_id, created
 
     def stats(self) -> Dict:
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        def c(t):
-            try: return cur.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
-            except: return 0
+        # من جدول العدّادات (triggers) بدل COUNT(*) على الجداول
+        c = counters.read(self._con())
         size_mb = round(os.path.getsize(self.db_path)/(1024*1024), 3) if os.path.exists(self.db_path) else 0
-        out = {"db_exists": os.path.exists(self.db_path), "size_mb": size_mb,
-               "docs": c("docs"), "chunks": c("chunks"), "insights": c("insights")}
-        con.close(); return out
+        return {"db_exists": os.path.exists(self.db_path), "size_mb": size_mb,
+                "docs": c.get("docs", 0), "chunks": c.get("chunks", 0), "insights": c.get("insights", 0),
+                "index": len(self.index), "embedder": get_embedder().stats()}
+
+    def embed_missing(self, batch: int = 64, limit: int = 0) -> int:
+        """احسب متجهات المقاطع التي لا متجه لها، على دفعات، واحفظها (limit=0 بلا حد)."""
+        con = self._con(); done = []
+        if self.readonly: return 0
+        while not limit or len(done) < limit:
+            n = batch if not limit else min(batch, limit - len(done))
+            rows = con.execute(f"SELECT c.id, {chunking.text_sql()} FROM {chunking.JOIN_DOCS} "
+                               f"WHERE c.emb IS NULL AND (c.text IS NOT NULL OR c.stop IS NOT NULL) "
+                               f"ORDER BY c.id LIMIT ?", (n,)).fetchall()
+            if not rows: break
+            with tracing.span("embed"):
+                embs = get_embedder().encode([t or "" for _, t in rows])
+            with con:
+                con.executemany("UPDATE chunks SET emb=? WHERE id=?",
+                                [(quant.encode(e), cid) for (cid, _), e in zip(rows, embs)])
+            done += [cid for cid, _ in rows]
+        # معرّفاتها غالبًا تحت آخر معرّف مفهرس (مقاطع news_worker)، فلا يكفي sync
+        if done: self.index.fill(con, done)
+        return len(done)
+
+    def _hits(self, con, scored) -> List[Dict]:
+        # نجسّد نصوص المرشحين الفائزين فقط (substr من docs.text)
+        if not scored: return []
+        marks = ",".join("?" * len(scored))
+        rows = {r[0]: r[1:] for r in con.execute(f"SELECT c.id, c.doc_id, {chunking.text_sql()} FROM {chunking.JOIN_DOCS} "
+                                                 f"WHERE c.id IN ({marks})", [cid for cid, _ in scored])}
+        return [{"chunk_id": cid, "doc_id": rows[cid][0], "text": rows[cid][1], "score": s}
+                for cid, s in scored if cid in rows]
+
+    def _vector_search(self, con, qv, top_k: int):
+        # الفهرس المكمّم يرشّح top_k × RESCORE، ثم نعيد التقييم بمتجهات chunks.emb إن كانت أدق منه
+        if not quant.rescores(self.index.dtype):
+            return self.index.search(qv, top_k)
+        cand = self.index.search(qv, top_k * quant.RESCORE)
+        if not cand: return []
+        marks = ",".join("?" * len(cand))
+        prec = quant.PRECISION[self.index.dtype]
+        rows = [r for r in con.execute(f"SELECT id, emb FROM chunks WHERE id IN ({marks})", [c for c, _ in cand])
+                if quant.PRECISION.get(quant.blob_dtype(r[1]), -1) > prec]
+        if not rows: return cand[:top_k]
+        S = quant.decode_many([r[1] for r in rows]) @ np.asarray(qv, dtype=np.float32)
+        return sorted(((r[0], float(s)) for r, s in zip(rows, S)), key=lambda x: -x[1])[:top_k]
+
+    def _timed(self, kind, fn, *args):
+        t0 = time.perf_counter()
+        try: return fn(*args)
+        finally: self.latency.observe(kind, time.perf_counter() - t0)
 
     def search_chunks(self, query: str, top_k: int = 6) -> List[Dict]:
-        # اجلب كل المتجهات (لمشروع صغير تكفي – لاحقًا استبدلها بFAISS)
-        con = sqlite3.connect(self.db_path); cur = con.cursor()
-        cur.execute("SELECT id, text, emb FROM chunks")
-        rows = cur.fetchall(); con.close()
-        if not rows: return []
-        texts, embs, ids = [], [], []
-        for cid, text, emb in rows:
-            ids.append(cid); texts.append(text); embs.append(np.frombuffer(emb, dtype=np.float32))
-        Q = np.array([np.frombuffer(b"", dtype=np.float32)])  # dummy to init shape
-        # تقريبي: استخدم نفس دالة التجزئة كتمثيل للبحث بدون نموذج (يمكن تحسينه)
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        qv = model.encode([query], normalize_embeddings=True)
-        S = cosine_similarity(qv, np.vstack(embs)).ravel()
-        idx = np.argsort(S)[::-1][:top_k]
-        return [{"chunk_id": int(ids[i]), "text": texts[i], "score": float(S[i])} for i in idx]
+        return self._timed("vector", self._search_chunks, query, top_k)
+
+    def _search_chunks(self, query, top_k):
+        # top-k متجهي واحد فوق فهرس mmap، ثم نجلب نصوص الفائزين فقط
+        con = self._con()
+        self._sync(con)
+        if not len(self.index): return []
+        qv = get_embedder().encode(query)[0]
+        return self._hits(con, self._vector_search(con, qv, top_k))
+
+    def search_lexical(self, query: str, top_k: int = 6) -> List[Dict]:
+        """BM25 عبر FTS5 فقط (لا يحتاج النموذج)."""
+        return self._timed("lexical", self._search_lexical, query, top_k)
+
+    def _search_lexical(self, query, top_k):
+        con = self._con()
+        return self._hits(con, [(cid, -s) for cid, s in fts.search(con, query, top_k)])
+
+    def search_hybrid(self, query: str, top_k: int = 6, candidates: int = 50) -> List[Dict]:
+        """مرشحو FTS5 (BM25) ومرشحو الفهرس المتجهي، مدموجين بـ Reciprocal Rank Fusion."""
+        return self._timed("hybrid", self._search_hybrid, query, top_k, candidates)
+
+    def _search_hybrid(self, query, top_k, candidates):
+        con = self._con()
+        lexical = [cid for cid, _ in fts.search(con, query, candidates)]
+        self._sync(con)
+        vector = []
+        if len(self.index):
+            qv = get_embedder().encode(query)[0]
+            vector = [cid for cid, _ in self._vector_search(con, qv, candidates)]
+        return self._hits(con, fts.rrf(lexical, vector)[:top_k])
+
+_instances: Dict[str, Memory] = {}
+_instances_lock = threading.Lock()
+
+def get_memory(db_path: str = None) -> Memory:
+    """Memory مشتركة لكل مسار قاعدة داخل العملية (فهرس ونموذج دافئان).
+    مع AUTOLEARN_SHARDS=month|source تُعاد ShardedMemory بالواجهة نفسها."""
+    path = db_path or os.getenv("AUTOLEARN_DB", "/data/autolearn.db")
+    import shards
+    if shards.LAYOUT: return shards.get_sharded(path)
+    with _instances_lock:
+        mem = _instances.get(path)
+        if mem is None:
+            mem = _instances[path] = Memory(path); mem.init()
+    return mem
@@ -1,175 +1,237 @@
 # news_worker.py
-import os, re, time, argparse, sqlite3, datetime as dt
-import requests, feedparser, yaml
-from urllib.parse import urlparse
-from readability import Document
-from lxml.html.clean import Cleaner
+import os, re, time, argparse
+from functools import partial
+import feedparser, yaml
+from urllib.parse import urlparse, quote
+from crawler import CrawlPipeline
+import extract, http_client
+import db, schema, retention, fetch_state, dedup, chunking, tracing
+from memory import get_memory
 
 CONFIG_PATH = os.path.join(os.getcwd(), "config.yaml")
 DB_PATH = os.getenv("AUTOLEARN_DB", "/data/autolearn.db")
 
-HTML_CLEANER = Cleaner(
-    style=True, links=False, remove_unknown_tags=False,
-    javascript=True, scripts=True, page_structure=False
-)
-
 def load_cfg():
     with open(CONFIG_PATH, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
 def ensure_db():
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("""CREATE TABLE IF NOT EXISTS docs(
-        id INTEGER PRIMARY KEY,
-        url TEXT UNIQUE,
-        title TEXT,
-        source TEXT,
-        created_at TEXT,
-        text TEXT
-    )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS chunks(
-        id INTEGER PRIMARY KEY,
-        doc_id INTEGER,
-        chunk_index INTEGER,
-        text TEXT,
-        FOREIGN KEY(doc_id) REFERENCES docs(id)
-    )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS insights(
-        id INTEGER PRIMARY KEY,
-        doc_id INTEGER,
-        summary TEXT,
-        created_at TEXT,
-        FOREIGN KEY(doc_id) REFERENCES docs(id)
-    )""")
-    con.commit(); con.close()
+    # المخطط الموحّد مع Memory (ترحيلات user_version)
+    schema.ensure(db.connect(DB_PATH))
 
-def fetch_url_clean(url, timeout=12):
+def max_page_bytes(cfg):
+    return int(((cfg or {}).get("safety") or {}).get("max_page_bytes") or extract.MAX_BYTES)
+
+def fetch_html(url, timeout=12, max_bytes=extract.MAX_BYTES):
     try:
-        r = requests.get(url, timeout=timeout, headers={"User-Agent":"Mozilla/5.0"})
-        r.raise_for_status()
-        doc = Document(r.text)
-        title = doc.short_title() or url
-        html = HTML_CLEANER.clean_html(doc.summary())
-        text = re.sub(r"\s+", " ", re.sub("<[^>]+>", " ", html)).strip()
-        return title, text
+        # جلب متدفق حتى max_bytes وفك ترميز واحد
+        with tracing.span("fetch.http"):
+            page = extract.fetch(url, timeout, max_bytes)
+            html = extract.page_text(page)
+        # نتذكّر الرابط حتى لا يُجلب مجددًا في الدورات التالية
+        fetch_state.update(db.connect(DB_PATH), url, content_hash=fetch_state.content_hash(page.content))
+        return html
+    except Exception:
+        return None
+
+def fetch_feed(url, timeout=12, max_bytes=extract.MAX_BYTES):
+    """الخلاصة المحللة، أو None إن لم تتغير (304 أو نفس البصمة)."""
+    con = db.connect(DB_PATH)
+    st = fetch_state.get(con, url)
+    with tracing.span("fetch.feed"):
+        page = extract.fetch(url, timeout, max_bytes, headers=fetch_state.conditional_headers(st))
+    if page.status == 304:
+        return None
+    h = fetch_state.content_hash(page.content)
+    unchanged = bool(st) and st.get("content_hash") == h
+    fetch_state.update(con, url, etag=page.headers.get("ETag"),
+                       last_modified=page.headers.get("Last-Modified"), content_hash=h)
+    if unchanged: return None
+    with tracing.span("parse.feed"):
+        return feedparser.parse(page.content)
+
+def fetch_new(pipe, links, source):
+    # استبعاد الروابط المعروفة باستعلام واحد قبل أي جلب
+    known = get_memory(DB_PATH).known_urls(links)
+    for link in links:
+        if link not in known:
+            pipe.fetch(link, source)
+
+def extract_html(url, html):
+    # تحليل lxml واحد: العنوان والمحتوى الرئيسي والنص من الشجرة نفسها
+    try:
+        title, text = extract.extract(html)
+        return title or url, text
     except Exception:
         return None, None
 
+def fetch_url_clean(url, timeout=12):
+    html = fetch_html(url, timeout)
+    return extract_html(url, html) if html else (None, None)
+
 def is_blocked(url, blocked_domains):
     host = urlparse(url).hostname or ""
     return any(bd in host for bd in blocked_domains)
 
+def chunk_text(text, size=1200):
+    # مقاطع ~1200 حرف عند حدود الجمل، كمواضع داخل نص المستند
+    with tracing.span("chunk"):
+        return list(chunking.spans(text, size))
+
 def add_doc(url, title, text, source):
+    return store_doc(url, title, text, source, chunk_text(text or ""))
+
+def detect_lang(text):
+    # يكفي للتصنيف: نسبة الحروف العربية بين الحروف
+    letters = re.findall(r"[^\W\d_]", text[:4000])
+    arabic = sum(1 for ch in letters if "\u0600" <= ch <= "\u06ff")
+    return "ar" if letters and arabic * 2 >= len(letters) else "en"
+
+def store_doc(url, title, text, source, chunks):
     if not text or len(text) < 200: 
         return None
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    try:
-        cur.execute("INSERT OR IGNORE INTO docs(url,title,source,created_at,text) VALUES (?,?,?,?,?)",
-                    (url, title or url, source, dt.datetime.utcnow().isoformat(), text))
-        con.commit()
-        cur.execute("SELECT id FROM docs WHERE url=?", (url,))
-        doc_id = cur.fetchone()[0]
-    except Exception:
-        con.close()
-        return None
-    # chunking بسيط ~1200 حرف
-    size = 1200
-    chunks = [text[i:i+size] for i in range(0, len(text), size)]
-    for i, ch in enumerate(chunks):
-        cur.execute("INSERT INTO chunks(doc_id,chunk_index,text) VALUES(?,?,?)", (doc_id, i, ch))
     # تلخيص بسيط (أول 40-60 كلمة)
     words = re.findall(r"\w+", text)
     summary = " ".join(words[:60]) + ("..." if len(words) > 60 else "")
-    cur.execute("INSERT INTO insights(doc_id,summary,created_at) VALUES(?,?,?)",
-                (doc_id, summary, dt.datetime.utcnow().isoformat()))
-    con.commit(); con.close()
-    return doc_id
+    try:
+        # طبقة التخزين نفسها التي يستعملها Learner: المستند ومقاطعه (مواضع) وتلخيصه في معاملة
+        # واحدة، مع البصمة و df وإسقاط الإجابات المخزّنة عن الموضوع
+        with tracing.span("store"):
+            doc_id, new = get_memory(DB_PATH).add_document_with_chunks(url, title or url, text, source, detect_lang(text),
+                                                                       chunks, insights=[summary])
+            # المعرّف فقط لصف أُدرج فعلًا، فعدّاد stored لا يحسب المكرر
+            return doc_id if new else None
+    except Exception:
+        return None
 
-def crawl_rss(url, cfg):
+def crawl_rss(url, cfg, pipe):
     blocked = cfg.get("blocked_domains", []) or []
     try:
-        feed = feedparser.parse(url)
+        feed = fetch_feed(url, max_bytes=max_page_bytes(cfg))
+        if feed is None:
+            pipe.count("feeds_unchanged")
+            return
+        links = []
         for e in feed.entries[:10]:
             link = getattr(e, "link", None) or getattr(e, "id", None)
             if not link or is_blocked(link, blocked): 
                 continue
-            title, text = fetch_url_clean(link)
-            if title and text:
-                add_doc(link, title, text, source="rss")
+            links.append(link)
+        fetch_new(pipe, links, "rss")
     except Exception as ex:
         print("RSS error:", url, ex)
 
-def crawl_arxiv(cat, cfg):
+def crawl_arxiv(cat, cfg, pipe):
     rss = f"https://export.arxiv.org/rss/{cat}"
-    crawl_rss(rss, cfg)
+    crawl_rss(rss, cfg, pipe)
 
-def crawl_wikipedia(keywords, cfg):
-    # نبسّط: نأخذ صفحة بحث ويكي الأولى ونجرّب أول نتيجة
+WIKI = "https://ar.wikipedia.org"
+
+def search_wikipedia(kw, pipe):
+    # أول نتيجة من api.php. robots.txt في ويكيبيديا يمنع /w/ (ومعه api.php) عن الزواحف، لكن
+    # الواجهة البرمجية هي الطريق الذي تطلبه ويكيميديا من البرامج (سياسة API: User-Agent واضح
+    # وطلبات متتابعة بمعدل محدود)، فنستثنيها صراحةً؛ صفحة المقال نفسها (/wiki/) تمر بفحص robots.
+    try:
+        r = http_client.get_client().get(WIKI + "/w/api.php", robots=False, timeout=12,
+                                         params={"action": "query", "list": "search", "srsearch": kw,
+                                                 "srlimit": 1, "srprop": "", "format": "json"})
+        r.raise_for_status()
+        hits = r.json().get("query", {}).get("search", [])
+        if hits:
+            fetch_new(pipe, [WIKI + "/wiki/" + quote(hits[0]["title"].replace(" ", "_"))], "wikipedia")
+    except Exception as ex:
+        print("Wikipedia error:", kw, ex)
+
+def crawl_wikipedia(keywords, cfg, pipe):
     for kw in keywords[:3]:
-        try:
-            s = requests.get("https://ar.wikipedia.org/w/index.php",
-                             params={"search": kw}, timeout=12).text
-            m = re.search(r'href="(/wiki/[^"]+)"', s)
-            if not m: 
-                continue
-            url = "https://ar.wikipedia.org" + m.group(1)
-            title, text = fetch_url_clean(url)
-            if title and text:
-                add_doc(url, title, text, source="wikipedia")
-        except Exception as ex:
-            print("Wikipedia error:", kw, ex)
-
-def crawl_personal_files(cfg):
+        pipe.spawn(WIKI + "/", search_wikipedia, kw, pipe)
+
+def crawl_personal_files(cfg, pipe):
     folder = cfg.get("personal_files_dir", "/data/inbox")
     try:
         os.makedirs(folder, exist_ok=True)
-        for fn in os.listdir(folder):
-            if not fn.lower().endswith((".txt", ".md")):
-                continue
+        files = [fn for fn in os.listdir(folder) if fn.lower().endswith((".txt", ".md"))]
+        known = get_memory(DB_PATH).known_urls([f"file://{os.path.join(folder, fn)}" for fn in files])
+        for fn in files:
             path = os.path.join(folder, fn)
+            if f"file://{path}" in known:
+                continue
             with open(path, "r", encoding="utf-8", errors="ignore") as f:
                 text = f.read()
             if len(text) < 50: 
                 continue
             url = f"file://{path}"
-            add_doc(url, os.path.splitext(fn)[0], text, source="personal")
+            pipe.put_text(url, os.path.splitext(fn)[0], text, "personal")
     except Exception as ex:
         print("Personal files error:", ex)
 
-def run_cycle():
-    cfg = load_cfg()
-    ensure_db()
-
-    # RSS
-    for rss in cfg.get("rss_feeds", []):
-        crawl_rss(rss, cfg)
-
-    # arXiv
-    for cat in cfg.get("arxiv_queries", []):
-        crawl_arxiv(cat, cfg)
+SOURCES = ("rss", "arxiv", "wikipedia", "inbox")
 
-    # ويكيبيديا (بالكلمات المفتاحية)
-    crawl_wikipedia(cfg.get("learning_keywords", []), cfg)
+def _dedupe(deduper):
+    def check(url, text):
+        with tracing.span("dedup"):
+            return deduper.check(url, text)
+    return check
 
-    # ملفات شخصية
-    crawl_personal_files(cfg)
+def run_cycle(cfg=None, sources=SOURCES, profile=None):
+    cfg = cfg or load_cfg()
+    ensure_db()
+    max_bytes = max_page_bytes(cfg)
+    if profile:
+        with tracing.profile(profile):
+            stats = run_cycle(cfg, sources)
+        print("📈 cProfile →", profile)
+        return stats
+    tracing.take()  # نبدأ الدورة بمدرّجات فارغة
+    # Session مشتركة بحد معدل لكل نطاق و robots.txt حسب الإعدادات؛ تُبنى من جديد فقط إن تغيّرت
+    http_client.configure(cfg, DB_PATH)
+
+    # كل المصادر تُجدول معًا؛ المحرك يحدّ التوازي عامًا ولكل مضيف
+    deduper = dedup.Deduper(DB_PATH)
+    with CrawlPipeline(cfg, fetch=partial(fetch_html, max_bytes=max_bytes), extract=extract_html, chunk=chunk_text,
+                       store=store_doc, dedupe=_dedupe(deduper)) as pipe:
+        # RSS
+        if "rss" in sources:
+            for rss in cfg.get("rss_feeds", []):
+                pipe.spawn(rss, crawl_rss, rss, cfg, pipe)
+
+        # arXiv
+        if "arxiv" in sources:
+            for cat in cfg.get("arxiv_queries", []):
+                pipe.spawn("https://export.arxiv.org/", crawl_arxiv, cat, cfg, pipe)
+
+        # ويكيبيديا (بالكلمات المفتاحية)
+        if "wikipedia" in sources:
+            crawl_wikipedia(cfg.get("learning_keywords", []), cfg, pipe)
+
+        # ملفات شخصية
+        if "inbox" in sources:
+            crawl_personal_files(cfg, pipe)
+    print(f"✅ cycle [{','.join(sources)}]:", dict(pipe.stats))
+    stages = tracing.take()
+    if stages:
+        tracing.persist(db.connect(DB_PATH), ",".join(sources), pipe.stats["seconds"], stages)
+        print("⏱️ stages:", ", ".join(f"{k} {v['total_ms']:.0f}ms/{v['n']}" for k, v in stages.items()))
+    return dict(pipe.stats)
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--once", action="store_true")
     ap.add_argument("--loop", action="store_true")
     ap.add_argument("--interval", type=int, default=10)
+    ap.add_argument("--profile", help="cProfile output path for a single cycle (--once)")
     args = ap.parse_args()
 
     if args.once:
         print("▶️ Running single learning cycle ...")
-        run_cycle()
+        run_cycle(profile=args.profile)
     elif args.loop:
         print(f"🔁 Loop mode every {args.interval} min")
+        maint = retention.Maintainer(DB_PATH)
         while True:
-            run_cycle()
+            cfg = load_cfg()
+            run_cycle(cfg)
+            maint.run(cfg)  # الاحتفاظ و incremental_vacuum بين الدورات
             time.sleep(args.interval * 60)
     else:
         # افتراضي: دورة واحدة
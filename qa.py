@@ -1,36 +1,34 @@
-import os, sqlite3, time
+import os, time
 from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from duckduckgo_search import DDGS
-from readability import Document
-from bs4 import BeautifulSoup
-import requests
-import numpy as np
+import extract
+from memory import get_memory
+from answer_cache import AnswerCache
+import tracing
 
 USE_OPENAI = bool(os.getenv("OPENAI_API_KEY"))
 USE_GEMINI = bool(os.getenv("GEMINI_API_KEY"))
 DB_PATH = os.getenv("AUTOLEARN_DB", "autolearn.db")
 
-from sentence_transformers import SentenceTransformer
-_embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+# ميزانية زمنية كلية لجمع السياق (ذاكرة + بحث + جلب) قبل استدعاء النموذج
+BUDGET_SEC = float(os.getenv("AUTOLEARN_QA_BUDGET", "15"))
+# مهلة طلب DDG الواحد؛ الجلب مقيّد بمهلته وبموعد قراءة نهائي
+SEARCH_TIMEOUT = int(os.getenv("AUTOLEARN_SEARCH_TIMEOUT", "10"))
 
-def _emb(text: str) -> np.ndarray:
-    v = _embedder.encode([text], normalize_embeddings=True)[0]
-    return v.astype(np.float32)
+# أقصى عدد مقاطع بلا متجه تُحسب أثناء سؤال واحد (الباقي يُستكمل في الأسئلة التالية)
+EMBED_BUDGET = int(os.getenv("AUTOLEARN_EMBED_BUDGET", "256"))
 
-def _fetch_url(url: str, limit=120000) -> str:
+def _fetch_url(url: str, limit=120000, timeout=12) -> str:
+    # لا نقرأ أكثر من limit بايت من الصفحة ولا بعد timeout كليًا، ثم تحليل واحد
     try:
-        r = requests.get(url, timeout=12, headers={"User-Agent":"Mozilla/5.0"})
-        r.raise_for_status()
-        html = r.text[:limit]
-        doc = Document(html)
-        txt = BeautifulSoup(doc.summary(), "lxml").get_text(" ", strip=True)
-        return txt
+        return extract.fetch_text(url, timeout, max_bytes=limit, deadline=time.monotonic() + timeout)[1]
     except Exception:
         return ""
 
 def _search_web(q: str, k=5) -> List[Tuple[str,str]]:
     res = []
-    with DDGS() as ddgs:
+    with DDGS(timeout=SEARCH_TIMEOUT) as ddgs:
         for r in ddgs.text(q, max_results=k, safesearch="moderate", region="wt-wt"):
             u = r.get("href") or r.get("url")
             t = r.get("title","")
@@ -38,23 +36,14 @@ def _search_web(q: str, k=5) -> List[Tuple[str,str]]:
     return res
 
 def _topk_memory(q: str, k=6) -> List[Tuple[str,str]]:
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
+    # نقيّم مقابل المتجهات المخزّنة وقت الإدخال بدل إعادة ترميز المقاطع مع كل سؤال
     try:
-        cur.execute("SELECT doc_id, text FROM chunks LIMIT 2000")
-        rows = cur.fetchall()
+        mem = get_memory(DB_PATH)
+        mem.embed_missing(limit=EMBED_BUDGET)
+        hits = mem.search_hybrid(q, top_k=k)
     except Exception:
-        rows = []
-    con.close()
-    if not rows: return []
-    qv = _emb(q)
-    scored = []
-    for doc_id, text in rows:
-        tv = _emb(text[:512])
-        sim = float(np.dot(qv, tv))
-        scored.append((sim, doc_id, text))
-    scored.sort(reverse=True, key=lambda x: x[0])
-    return [(doc_id, text) for _, doc_id, text in scored[:k]]
+        return []
+    return [(h["doc_id"], h["text"]) for h in hits]
 
 def _llm_answer(prompt: str) -> str:
     if USE_OPENAI:
@@ -74,15 +63,69 @@ def _llm_answer(prompt: str) -> str:
         return r.text or ""
     return "ملخص أولي (LLM غير مفعّل):\n" + prompt[:600]
 
-def answer_question(question: str) -> dict:
-    t0 = time.time()
-    mem_hits = _topk_memory(question, k=6)
-    web_hits = _search_web(question, k=5)
-    web_texts = []
-    for title, url in web_hits[:3]:
-        txt = _fetch_url(url)
-        if txt:
-            web_texts.append((title, url, txt[:2000]))
+_cache = None
+
+def _answer_cache():
+    global _cache
+    if _cache is None:
+        _cache = AnswerCache(DB_PATH, scope="qa")
+    return _cache
+
+def _timed(timings, stage, fn, *args):
+    t = time.perf_counter()
+    try:
+        with tracing.span(f"qa.{stage}"):
+            return fn(*args)
+    finally:
+        timings[stage] = round(time.perf_counter() - t, 3)
+
+def _result(fut, deadline, default):
+    # ننتظر حتى الموعد النهائي فقط؛ المتأخر يُلغى ونكمل بما وصل
+    try:
+        return fut.result(timeout=max(0.0, deadline - time.perf_counter()))
+    except Exception:
+        fut.cancel()
+        return default
+
+def answer_question(question: str, budget: float = BUDGET_SEC) -> dict:
+    t0 = time.perf_counter()
+    timings = {}
+    try:
+        cached, qv = _timed(timings, "cache", _answer_cache().get, question)
+    except Exception:
+        cached, qv = None, None
+    if cached:
+        timings["total"] = round(time.perf_counter() - t0, 3)
+        return {**cached, "latency": timings, "cached": True}
+
+    deadline = time.perf_counter() + budget
+    # مجمّع لكل سؤال: المتأخر (بحث أو جلب عالق) لا يحجز خيوط الأسئلة المتزامنة الأخرى،
+    # وينتهي وحده بمهلته؛ لا ننتظره عند الخروج
+    pool = ThreadPoolExecutor(max_workers=5, thread_name_prefix="qa")
+    try:
+        # الذاكرة والبحث على الويب بالتوازي
+        f_mem = pool.submit(_timed, timings, "memory", _topk_memory, question, 6)
+        f_web = pool.submit(_timed, timings, "search", _search_web, question, 5)
+        web_hits = _result(f_web, deadline, [])
+
+        # جلب صفحات النتائج بالتوازي ضمن ما تبقى من الميزانية
+        t_fetch = time.perf_counter()
+        left = max(1.0, deadline - t_fetch)
+        fetches = [(title, url, pool.submit(_fetch_url, url, 120000, min(12, left)))
+                   for title, url in web_hits[:3]]
+        wait([f for _, _, f in fetches], timeout=max(0.0, deadline - time.perf_counter()))
+        web_texts = []
+        for title, url, f in fetches:
+            txt = f.result() if f.done() and not f.exception() else ""
+            if not f.done(): f.cancel()
+            if txt:
+                web_texts.append((title, url, txt[:2000]))
+        if fetches:
+            timings["fetch"] = round(time.perf_counter() - t_fetch, 3)
+        mem_hits = _result(f_mem, deadline, [])
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    timings["context"] = round(time.perf_counter() - t0, 3)
 
     ctx = []
     if mem_hits:
@@ -91,6 +134,7 @@ def answer_question(question: str) -> dict:
         ctx.append("## أحدث ما وُجد على الويب:\n" +
                    "\n\n".join(f"{t}\n{u}\n{tx[:400]}" for t,u,tx in web_texts))
 
+    ctx_text = "\n\n".join(ctx) if ctx else "لا سياق كافٍ"
     prompt = f"""سؤال: {question}
 
 المعايير:
@@ -99,14 +143,18 @@ def answer_question(question: str) -> dict:
 - لا تقدم تشخيصًا طبيًا مخصصًا.
 
 السياق:
-{'\n\n'.join(ctx) if ctx else 'لا سياق كافٍ'}
+{ctx_text}
 
 النتيجة: إجابة واضحة + نقاط + مصادر روابط إن توفرت.
 """
-    answer = _llm_answer(prompt)
-    return {
+    answer = _timed(timings, "llm", _llm_answer, prompt)
+    out = {
         "answer": answer,
         "sources": [u for _,u,_ in web_texts],
-        "latency": round(time.time()-t0, 2),
         "used_llm": USE_OPENAI or USE_GEMINI
     }
+    if qv is not None and out["used_llm"]:
+        try: _answer_cache().put(question, qv, out)
+        except Exception: pass
+    timings["total"] = round(time.perf_counter() - t0, 3)
+    return {**out, "latency": dict(timings), "cached": False}
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# ترميزات مضغوطة لمتجهات المقاطع (chunks.emb وملفات الفهرس):
+#   float32: 4 بايت/بُعد (1536 بايت للمتجه) — الصيغة القديمة
+#   float16: 2 بايت/بُعد (768 بايت)
+#   int8   : بايت/بُعد + معامل float32 لكل متجه (388 بايت)
+# الصيغة تُستنتج من طول الـBLOB، فالصفوف القديمة والجديدة تتعايش دون عمود إضافي.
+#
+#   python quant.py migrate --dtype float16 [--db ...] [--vacuum]
+#   python quant.py recall  --dtype int8 [--queries 200] [--k 10]
+import os, sys, time, argparse, numpy as np
+from typing import List
+
+DIM = 384
+DTYPES = ("float32", "float16", "int8")
+PRECISION = {"int8": 0, "float16": 1, "float32": 2}
+# صيغة التخزين في chunks.emb وصيغة الفهرس المتجهي
+STORE_DTYPE = os.getenv("AUTOLEARN_EMB_DTYPE", "float32")
+INDEX_DTYPE = os.getenv("AUTOLEARN_INDEX_DTYPE", STORE_DTYPE)
+# عدد المرشحين (× top_k) الذين يُعاد تقييمهم بدقة float بعد البحث المكمّم
+RESCORE = int(os.getenv("AUTOLEARN_RESCORE", "4"))
+
+def rescores(index_dtype: str, store_dtype: str = STORE_DTYPE) -> bool:
+    """إعادة التقييم بـ chunks.emb تفيد فقط إن كان المخزَّن أدق من الفهرس."""
+    return RESCORE > 1 and PRECISION[store_dtype] > PRECISION[index_dtype]
+
+def quantize_int8(M: np.ndarray):
+    M = np.atleast_2d(np.asarray(M, dtype=np.float32))
+    scale = np.abs(M).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(M / scale[:, None]), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+def encode(v: np.ndarray, dtype: str = STORE_DTYPE) -> bytes:
+    v = np.asarray(v, dtype=np.float32).ravel()
+    if dtype == "float16": return v.astype(np.float16).tobytes()
+    if dtype == "int8":
+        q, s = quantize_int8(v)
+        return s.tobytes() + q.tobytes()
+    return v.tobytes()
+
+def blob_dtype(blob: bytes, dim: int = DIM):
+    n = len(blob or b"")
+    return {dim * 4: "float32", dim * 2: "float16", dim + 4: "int8"}.get(n)
+
+def decode(blob: bytes, dim: int = DIM) -> np.ndarray:
+    kind = blob_dtype(blob, dim)
+    if kind == "float32": return np.frombuffer(blob, dtype=np.float32)
+    if kind == "float16": return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if kind == "int8":
+        s = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * s
+    raise ValueError(f"unknown embedding blob of {len(blob or b'')} bytes")
+
+def decode_many(blobs: List[bytes], dim: int = DIM) -> np.ndarray:
+    if not blobs: return np.zeros((0, dim), dtype=np.float32)
+    kinds = {blob_dtype(b, dim) for b in blobs}
+    if kinds == {"float32"}:
+        return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(-1, dim)
+    if kinds == {"float16"}:
+        return np.frombuffer(b"".join(blobs), dtype=np.float16).reshape(-1, dim).astype(np.float32)
+    return np.vstack([decode(b, dim) for b in blobs])
+
+# ---------- أدوات سطر الأوامر ----------
+def migrate(db_path: str, dtype: str, page: int = 2000, vacuum: bool = False):
+    import db
+    con = db.connect(db_path); last = done = 0; t0 = time.time()
+    before = os.path.getsize(db_path)
+    while True:
+        rows = con.execute("SELECT id, emb FROM chunks WHERE id > ? AND emb IS NOT NULL ORDER BY id LIMIT ?",
+                           (last, page)).fetchall()
+        if not rows: break
+        last = rows[-1][0]
+        todo = [(encode(decode(b), dtype), cid) for cid, b in rows if blob_dtype(b) not in (None, dtype)]
+        with con:
+            con.executemany("UPDATE chunks SET emb=? WHERE id=?", todo)
+        done += len(todo)
+    if vacuum:
+        con.execute("VACUUM"); con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"converted {done} embeddings to {dtype} in {time.time() - t0:.1f}s; "
+          f"db {before / 2**20:.1f}MB → {os.path.getsize(db_path) / 2**20:.1f}MB"
+          + ("" if vacuum else " (run with --vacuum to reclaim space)"))
+
+def roundtrip(X: np.ndarray, dtype: str) -> np.ndarray:
+    """X كما يُرى بعد تخزينه بصيغة dtype."""
+    if dtype == "float16": return X.astype(np.float16).astype(np.float32)
+    if dtype == "int8":
+        q8, s = quantize_int8(X); return q8.astype(np.float32) * s[:, None]
+    return X
+
+def recall(db_path: str, dtype: str, queries: int = 200, k: int = 10, sample: int = 200000,
+           store_dtype: str = STORE_DTYPE):
+    """recall@k للمطابقة المكممة مقابل float32 الدقيق، ومع إعادة التقييم بمتجهات
+    chunks.emb بصيغة store_dtype كما يجري وقت التشغيل."""
+    import db
+    con = db.connect(db_path)
+    rows = con.execute("SELECT emb FROM chunks WHERE emb IS NOT NULL ORDER BY id LIMIT ?", (sample,)).fetchall()
+    X = decode_many([r[0] for r in rows])
+    if len(X) <= k:
+        print("not enough embeddings"); return
+    rng = np.random.default_rng(0)
+    Q = X[rng.choice(len(X), size=min(queries, len(X)), replace=False)]
+    Xq, Xs = roundtrip(X, dtype), roundtrip(X, store_dtype)
+    bpv = {"float32": DIM * 4, "float16": DIM * 2, "int8": DIM + 4}[dtype]
+    rescore = rescores(dtype, store_dtype)
+    hit = hit_rs = 0
+    for qv in Q:
+        exact = set(np.argpartition(-(X @ qv), k)[:k])
+        approx = np.argpartition(-(Xq @ qv), k * RESCORE)[:k * RESCORE]
+        top = approx[np.argsort(-(Xq[approx] @ qv))][:k]
+        hit += len(exact & set(top))
+        if rescore:
+            rs = approx[np.argsort(-(Xs[approx] @ qv))][:k]
+            hit_rs += len(exact & set(rs))
+    n = len(Q) * k
+    print(f"{dtype}: {bpv} bytes/vector ({DIM * 4 / bpv:.1f}x smaller), vectors={len(X)}, recall@{k}={hit / n:.4f}, "
+          + (f"with rescore x{RESCORE} from {store_dtype}={hit_rs / n:.4f}" if rescore
+             else f"no rescore ({store_dtype} storage is not more precise than the index)"))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["migrate", "recall"])
+    ap.add_argument("--db", default=os.getenv("AUTOLEARN_DB", "/data/autolearn.db"))
+    ap.add_argument("--dtype", choices=DTYPES, default="float16")
+    ap.add_argument("--store-dtype", choices=DTYPES, default=STORE_DTYPE, help="chunks.emb format used to rescore (recall)")
+    ap.add_argument("--vacuum", action="store_true")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    args = ap.parse_args()
+    if args.cmd == "migrate":
+        migrate(args.db, args.dtype, vacuum=args.vacuum)
+    else:
+        recall(args.db, args.dtype, args.queries, args.k, store_dtype=args.store_dtype)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# الاحتفاظ حسب الحداثة (freshness_days) حتى يثبت حجم القاعدة على قرص محدود:
+#   أقدم من freshness_days          → بارد: تُحذف مقاطعه (متجهاتها وفهرس FTS) ويُضغط نصه في docs.ztext
+#   أقدم من retention.delete_after_days → يُحذف نهائيًا (مع معارفه وبصمته؛ fetch_state يمنع إعادة جلبه)
+# ثم يُستعاد المكان بـ PRAGMA incremental_vacuum على خطوات صغيرة بين الدورات، بدل VACUUM يحجب القاعدة.
+#
+#   python retention.py run [--db ...]   # تمريرة كاملة الآن
+#   python retention.py convert          # مرة واحدة لقاعدة أنشئت قبل auto_vacuum=INCREMENTAL (VACUUM كامل)
+import os, sys, time, zlib, argparse, datetime as dt
+from typing import Dict, List
+import db, schema, dedup, tfidf
+from vector_index import VectorIndex
+
+try:
+    import zstandard
+except ImportError:  # اختياري: zlib يكفي
+    zstandard = None
+
+# أول بايت يحدد الضاغط، فتتعايش الصفوف المضغوطة بأي منهما
+_ZLIB, _ZSTD = b"z", b"Z"
+
+def compress(text: str) -> bytes:
+    raw = (text or "").encode("utf-8")
+    if zstandard is not None:
+        return _ZSTD + zstandard.ZstdCompressor(level=9).compress(raw)
+    return _ZLIB + zlib.compress(raw, 9)
+
+def decompress(blob: bytes) -> str:
+    if not blob: return ""
+    if blob[:1] == _ZSTD:
+        if zstandard is None: raise RuntimeError("zstandard is required to read this document")
+        return zstandard.ZstdDecompressor().decompress(blob[1:]).decode("utf-8")
+    return zlib.decompress(blob[1:]).decode("utf-8")
+
+def doc_text(con, doc_id: int) -> str:
+    """نص المستند، ساخنًا كان أو مضغوطًا."""
+    row = con.execute("SELECT text, ztext FROM docs WHERE id=?", (doc_id,)).fetchone()
+    if not row: return ""
+    return row[0] if row[0] is not None else decompress(row[1])
+
+def policy(cfg: Dict = None) -> Dict:
+    cfg = cfg or {}
+    r = cfg.get("retention", {}) or {}
+    cold = float(r.get("cold_after_days", cfg.get("freshness_days", 540)) or 0)
+    return {"enabled": bool(r.get("enabled", True)), "cold_after_days": cold,
+            "delete_after_days": float(r.get("delete_after_days", cold * 2) or 0),
+            "keep_sources": list(r.get("keep_sources", ["personal"]) or []),
+            "batch": int(r.get("batch", 500)), "vacuum_pages": int(r.get("vacuum_pages", 2048)),
+            "interval_minutes": float(r.get("interval_minutes", 60))}
+
+def _cutoff(days: float) -> str:
+    return (dt.datetime.utcnow() - dt.timedelta(days=days)).isoformat()
+
+def _older(con, days: float, keep: List[str], batch: int, extra: str = "") -> List[int]:
+    if days <= 0: return []
+    q = (f"SELECT id FROM docs WHERE created_at < ? {extra} "
+         f"AND COALESCE(source, '') NOT IN ({','.join('?' * len(keep))}) ORDER BY created_at LIMIT ?")
+    return [r[0] for r in con.execute(q, (_cutoff(days), *keep, batch))]
+
+def demote(con, p: Dict) -> int:
+    """دفعة من المستندات الأقدم من نافذة الحداثة → نص مضغوط بلا مقاطع."""
+    ids = _older(con, p["cold_after_days"], p["keep_sources"], p["batch"], "AND text IS NOT NULL")
+    if not ids: return 0
+    marks = ",".join("?" * len(ids))
+    with con:
+        # المقاطع أولًا: trigger الحذف في FTS يقرأ مداها من docs.text قبل ضغطه
+        con.execute(f"DELETE FROM chunks WHERE doc_id IN ({marks})", ids)
+        rows = con.execute(f"SELECT id, text FROM docs WHERE id IN ({marks})", ids).fetchall()
+        con.executemany("UPDATE docs SET ztext=?, text=NULL WHERE id=?", [(compress(t), i) for i, t in rows])
+    return len(ids)
+
+def expire(con, p: Dict) -> int:
+    """دفعة من المستندات الأقدم من delete_after_days → حذف نهائي."""
+    ids = _older(con, p["delete_after_days"], p["keep_sources"], p["batch"])
+    if not ids: return 0
+    marks = ",".join("?" * len(ids))
+    with con:
+        cur = con.cursor()
+        # df يُنقص بنص المستند كما سُجّل عند إدخاله (مضغوطًا كان أو ساخنًا)
+        tfidf.forget(cur, [t if t is not None else decompress(z) for t, z in
+                           cur.execute(f"SELECT text, ztext FROM docs WHERE id IN ({marks})", ids).fetchall()])
+        cur.execute(f"DELETE FROM chunks WHERE doc_id IN ({marks})", ids)
+        cur.execute(f"DELETE FROM insights WHERE doc_id IN ({marks})", ids)
+        dedup.forget(cur, ids)
+        cur.execute(f"DELETE FROM docs WHERE id IN ({marks})", ids)
+    return len(ids)
+
+def vacuum_step(con, pages: int) -> int:
+    """أعد حتى pages صفحة حرة إلى نظام الملفات؛ يعيد عدد الصفحات الحرة المتبقية."""
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2: return 0
+    free = con.execute("PRAGMA freelist_count").fetchone()[0]
+    if not free: return 0
+    con.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    # checkpoint لا ينتظر القرّاء؛ الملف يُقص عند أول checkpoint مكتمل
+    con.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return con.execute("PRAGMA freelist_count").fetchone()[0]
+
+class Maintainer:
+    """صيانة على خطوات صغيرة بين الدورات: دفعة تبريد/حذف، ثم إعادة بناء الفهرس عند انتهاء
+    التمريرة، ثم incremental_vacuum حتى تنفد الصفحات الحرة."""
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._next = 0.0
+        self._changed = 0
+
+    def step(self, cfg: Dict = None) -> Dict:
+        p = policy(cfg)
+        out = {"demoted": 0, "expired": 0, "reindexed": 0, "free_pages": 0}
+        if not p["enabled"]: return out
+        import shards
+        if shards.LAYOUT and os.path.isdir(self.db_path + ".shards"):
+            # كل شظية تُبرَّد وتُحذف داخلها؛ شظايا الأشهر تُختم وتُحذف أيضًا بملفات كاملة
+            for k, v in shards.get_sharded(self.db_path).maintain(p).items(): out[k] = out.get(k, 0) + v
+        if not os.path.exists(self.db_path): return out
+        con = db.connect(self.db_path)
+        if time.time() >= self._next:
+            expired, demoted = expire(con, p), demote(con, p)
+            out["expired"] += expired; out["demoted"] += demoted
+            self._changed += expired + demoted
+            if expired < p["batch"] and demoted < p["batch"]:
+                # التمريرة انتهت: المتجهات القديمة تخرج من الفهرس الساخن
+                if self._changed:
+                    out["reindexed"] += VectorIndex(self.db_path).rebuild(con); self._changed = 0
+                self._next = time.time() + p["interval_minutes"] * 60
+        out["free_pages"] = vacuum_step(con, p["vacuum_pages"])
+        if out["demoted"] or out["expired"] or out["reindexed"] or out.get("dropped") or out.get("sealed"):
+            print(f"🧊 retention: {out['demoted']} demoted, {out['expired']} expired, "
+                  f"index {out['reindexed']} vectors, {out['free_pages']} free pages left"
+                  + (f", shards {out['sealed']} sealed / {out['dropped']} dropped" if "sealed" in out else ""))
+        return out
+
+    def run(self, cfg: Dict = None) -> Dict:
+        """تمريرة كاملة (سطر الأوامر ووضع --loop)."""
+        self._next = 0.0; total: Dict[str, int] = {k: 0 for k in ("demoted", "expired", "reindexed")}
+        if not policy(cfg)["enabled"]: return total
+        while True:
+            out = self.step(cfg)
+            for k in total: total[k] += out[k]
+            # بلا قاعدة أساسية (أو شظايا فقط) لا تتقدم _next: خطوة واحدة تكفي
+            # والشظايا ذات الدفعة الممتلئة (pending) تنتظر خطوة أخرى
+            if out.get("pending"): continue
+            if not os.path.exists(self.db_path) or (self._next and not out["free_pages"]): break
+        return total
+
+def convert(db_path: str):
+    """auto_vacuum يتغير لقاعدة موجودة فقط بـ VACUUM كامل (مرة واحدة، يحجب القاعدة)."""
+    con = db.connect(db_path)
+    before = os.path.getsize(db_path)
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL"); con.execute("VACUUM")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    print(f"auto_vacuum={con.execute('PRAGMA auto_vacuum').fetchone()[0]}; "
+          f"db {before / 2**20:.1f}MB → {os.path.getsize(db_path) / 2**20:.1f}MB")
+
+def main():
+    import yaml
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["run", "convert"])
+    ap.add_argument("--db", default=os.getenv("AUTOLEARN_DB", "/data/autolearn.db"))
+    ap.add_argument("--config", default=os.path.join(os.getcwd(), "config.yaml"))
+    args = ap.parse_args()
+    schema.ensure(db.connect(args.db))
+    if args.cmd == "convert":
+        return convert(args.db)
+    cfg = {}
+    if os.path.exists(args.config):
+        with open(args.config, "r", encoding="utf-8") as f: cfg = yaml.safe_load(f) or {}
+    print(Maintainer(args.db).run(cfg))
+
+if __name__ == "__main__":
+    sys.exit(main())
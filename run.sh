@@ -20,11 +20,11 @@ print("✅ DB created:", db)
 PY
 fi
 
-echo "🤖 بدء عامل التعلم الذاتي بالخلفية (كل $NEWS_INTERVAL_SEC ثانية)..."
+echo "🤖 بدء عامل التعلم الذاتي المقيم بالخلفية (الجداول من pace.schedules في config.yaml)..."
 (
-  while true; do
-    echo "⏳ [worker] تشغيل news_worker.py --once ..."
-    python news_worker.py --once || echo "⚠️ worker: حدث خطأ وسيُعاد المحاولة"
+  # الخروج السليم (ملف STOP) ينهي الحلقة؛ الانهيار يعيد التشغيل
+  until python autolearn.py; do
+    echo "⚠️ worker: توقف بخطأ وسيُعاد تشغيله بعد $NEWS_INTERVAL_SEC ثانية"
     sleep "$NEWS_INTERVAL_SEC"
   done
 ) &
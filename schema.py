@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# مخطط موحّد لـ docs/chunks/insights يستعمله الجميع (Memory و news_worker وأدوات سطر الأوامر)،
+# مع ترحيلات مرقّمة بـ PRAGMA user_version: كل ترحيل يُطبَّق مرة واحدة داخل معاملة.
+# الترحيل الأول يحوّل أي شكل قديم إلى التخطيط الموحّد:
+#   شكل news_worker: docs.created_at, chunks.chunk_index, insights.summary
+#   شكل Memory     : docs.lang/h, chunks.emb, insights.text
+#
+#   python schema.py migrate [--db ...]
+import os, sys, argparse
+from typing import Callable, List
+import fetch_state, dedup, chunking, fts, answer_cache, tfidf, counters, tracing
+
+TABLES = {
+    "docs": """CREATE TABLE IF NOT EXISTS docs(
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE,
+        title TEXT,
+        text TEXT,
+        source TEXT,
+        lang TEXT,
+        h TEXT,
+        created_at TEXT
+    )""",
+    "chunks": """CREATE TABLE IF NOT EXISTS chunks(
+        id INTEGER PRIMARY KEY,
+        doc_id INTEGER REFERENCES docs(id),
+        chunk_index INTEGER,
+        text TEXT,
+        emb BLOB,
+        start INTEGER,
+        stop INTEGER
+    )""",
+    "insights": """CREATE TABLE IF NOT EXISTS insights(
+        id INTEGER PRIMARY KEY,
+        doc_id INTEGER REFERENCES docs(id),
+        text TEXT,
+        created_at TEXT
+    )""",
+}
+# الأعمدة الموحّدة لكل جدول ونوعها (لإضافة الناقص في القواعد القديمة)
+COLUMNS = {
+    "docs": {"url": "TEXT", "title": "TEXT", "text": "TEXT", "source": "TEXT", "lang": "TEXT", "h": "TEXT",
+             "created_at": "TEXT"},
+    "chunks": {"doc_id": "INTEGER", "chunk_index": "INTEGER", "text": "TEXT", "emb": "BLOB",
+               "start": "INTEGER", "stop": "INTEGER"},
+    "insights": {"doc_id": "INTEGER", "text": "TEXT", "created_at": "TEXT"},
+}
+
+def _cols(con, table: str) -> List[str]:
+    return [r[1] for r in con.execute(f"PRAGMA table_info({table})")]
+
+def _v1_unify(con):
+    for t, ddl in TABLES.items():
+        con.execute(ddl)
+    # insights.summary (news_worker) → insights.text
+    cols = _cols(con, "insights")
+    if "summary" in cols and "text" not in cols:
+        con.execute("ALTER TABLE insights RENAME COLUMN summary TO text")
+    for t, want in COLUMNS.items():
+        have = _cols(con, t)
+        for col, typ in want.items():
+            if col not in have: con.execute(f"ALTER TABLE {t} ADD COLUMN {col} {typ}")
+    if "summary" in _cols(con, "insights"):  # الشكلان معًا: ندمج ما كتبه news_worker
+        con.execute("UPDATE insights SET text = summary WHERE text IS NULL")
+    # تواريخ مستندات Memory القديمة: أول جلب مسجّل للرابط إن وُجد
+    if con.execute("SELECT 1 FROM sqlite_master WHERE name='fetch_state'").fetchone():
+        con.execute("UPDATE docs SET created_at = (SELECT f.fetched_at FROM fetch_state f WHERE f.url = docs.url) "
+                    "WHERE created_at IS NULL")
+    con.execute("UPDATE insights SET created_at = (SELECT d.created_at FROM docs d WHERE d.id = insights.doc_id) "
+                "WHERE created_at IS NULL")
+    # ترتيب المقاطع داخل المستند لصفوف Memory
+    con.execute("""UPDATE chunks SET chunk_index = r.i FROM (
+                       SELECT id, row_number() OVER (PARTITION BY doc_id ORDER BY id) - 1 AS i FROM chunks) r
+                   WHERE chunks.id = r.id AND chunks.chunk_index IS NULL""")
+
+def _v2_indexes(con):
+    con.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(doc_id, chunk_index)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_insights_doc ON insights(doc_id)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_docs_created ON docs(created_at)")
+    # المقاطع بلا متجه (embed_missing / backfill) دون مسح الجدول كله
+    con.execute("CREATE INDEX IF NOT EXISTS idx_chunks_noemb ON chunks(id) WHERE emb IS NULL")
+
+def _v3_cold_text(con):
+    # نص المستندات الباردة مضغوطًا (retention.py)؛ docs.text يصبح NULL لها
+    if "ztext" not in _cols(con, "docs"): con.execute("ALTER TABLE docs ADD COLUMN ztext BLOB")
+
+MIGRATIONS: List[Callable] = [_v1_unify, _v2_indexes, _v3_cold_text]
+VERSION = len(MIGRATIONS)
+
+def version(con) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(con) -> int:
+    """طبّق الترحيلات الناقصة بالترتيب؛ يعيد الإصدار النهائي."""
+    if version(con) >= VERSION: return VERSION
+    con.commit()
+    con.execute("BEGIN IMMEDIATE")  # عمليتان تبدآن معًا: الثانية تنتظر ثم ترى الإصدار الجديد
+    try:
+        v = version(con)
+        for i in range(v, VERSION):
+            MIGRATIONS[i](con)
+        con.execute(f"PRAGMA user_version={VERSION}")
+        con.commit()
+    except Exception:
+        con.rollback(); raise
+    return VERSION
+
+def ensure(con):
+    """المخطط الموحّد ثم جداول الميزات (triggers والفهارس المساعدة)."""
+    migrate(con)
+    fetch_state.ensure(con)
+    dedup.ensure(con)
+    chunking.ensure(con)
+    fts.ensure(con)
+    answer_cache.ensure(con)
+    tfidf.ensure(con)
+    counters.ensure(con)
+    tracing.ensure(con)
+
+def main():
+    import db
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["migrate"])
+    ap.add_argument("--db", default=os.getenv("AUTOLEARN_DB", "/data/autolearn.db"))
+    args = ap.parse_args()
+    con = db.connect(args.db)
+    before = version(con)
+    ensure(con)
+    print(f"schema v{before} → v{version(con)}: " + "; ".join(f"{t}({', '.join(_cols(con, t))})" for t in TABLES))
+
+if __name__ == "__main__":
+    sys.exit(main())
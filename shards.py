@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+# تخزين مُجزّأ اختياري (AUTOLEARN_SHARDS=month|source): ملف SQLite وفهرس متجهي لكل شهر
+# أو لكل مصدر (rss, arxiv, wikipedia, personal...) بدل autolearn.db واحد يكبر بلا حد.
+#   - الكتابة تُوجَّه إلى شظية واحدة، فلكل شظية قفل كاتب مستقل وشجرة B أصغر
+#   - البحث يتفرع إلى كل الشظايا في مجمّع خيوط، ثم تُدمج أفضل k عالميًا
+#   - شظايا الأشهر السابقة تُختم: متجهات كاملة و checkpoint، ثم تُفتح mode=ro (قراءة عبر mmap)
+#   - الاحتفاظ يبرّد ويحذف داخل كل شظية، وفي الأشهر يحذف شظية كاملة (حذف ملفات) بدل DELETE صفًا صفًا
+# المعرّفات المُعادة عامة: (رقم الشظية << 32) | المعرّف المحلي، فتعمل add_chunks(doc_id) كما في Memory.
+# news_worker يخزّن عبر get_memory فتصل مستنداته إلى الشظايا؛ القاعدة الأساسية تبقى لحالة الزحف
+# (fetch_state و robots_cache وتتبّع الدورات).
+#
+#   python shards.py list|seal|drop NAME [--db ...]
+import os, re, sys, glob, time, argparse, threading, datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import db, fts, dedup, counters, fetch_state, retention
+from memory import Memory
+from embedder import get_embedder
+
+LAYOUT = os.getenv("AUTOLEARN_SHARDS", "").lower()  # "" = قاعدة واحدة
+LAYOUTS = ("month", "source")
+_BITS = 32
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard")
+
+CATALOG_DDL = """CREATE TABLE IF NOT EXISTS shards(
+    no INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,
+    sealed INTEGER DEFAULT 0,
+    created_at TEXT
+)"""
+
+def gid(no: int, local: int) -> int:
+    return (no << _BITS) | local
+
+def split(g: int) -> Tuple[int, int]:
+    return g >> _BITS, g & ((1 << _BITS) - 1)
+
+def _month(t: dt.datetime = None) -> str:
+    return (t or dt.datetime.utcnow()).strftime("%Y-%m")
+
+class ShardedMemory:
+    """واجهة Memory نفسها فوق مجلد شظايا <db>.shards/ وفهرسها catalog.db."""
+    def __init__(self, db_path: str, layout: str = LAYOUT):
+        if layout not in LAYOUTS: raise ValueError(f"unknown shard layout {layout!r}")
+        self.db_path, self.layout = db_path, layout
+        self.dir = db_path + ".shards"
+        self.catalog = os.path.join(self.dir, "catalog.db")
+        self._lock = threading.Lock()
+        self._mems: Dict[int, Memory] = {}
+        self._changed: Dict[int, int] = {}  # صفوف بُرّدت/حُذفت منذ آخر إعادة بناء لفهرس كل شظية
+        # زمن البحث يُسجَّل مرة للاستعلام المتفرع كله، في الفهرس لا في الشظايا المختومة
+        self.latency = counters.LatencyRecorder(self.catalog)
+
+    def init(self):
+        os.makedirs(self.dir, exist_ok=True)
+        con = db.connect(self.catalog)
+        con.execute(CATALOG_DDL); con.execute(counters.ddl()[1]); con.commit()
+
+    # ---------- الشظايا ----------
+    def _rows(self) -> List[Tuple[int, str, int]]:
+        return db.connect(self.catalog).execute("SELECT no, name, sealed FROM shards ORDER BY no").fetchall()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, f"{name}.db")
+
+    def _memory(self, no: int, name: str, sealed: int) -> Memory:
+        with self._lock:
+            mem = self._mems.get(no)
+            if mem is None or mem.readonly != bool(sealed):
+                mem = self._mems[no] = Memory(self.path(name), readonly=bool(sealed), cache_path=self.db_path)
+                mem.init()
+            return mem
+
+    def shards(self) -> List[Tuple[int, str, Memory]]:
+        return [(no, name, self._memory(no, name, sealed)) for no, name, sealed in self._rows()]
+
+    def route(self, source: str = None) -> Tuple[int, Memory]:
+        """الشظية القابلة للكتابة لهذا المستند (تُنشأ عند الحاجة)."""
+        name = _month() if self.layout == "month" else (re.sub(r"[^\w-]+", "_", source or "") or "other")
+        con = db.connect(self.catalog)
+        row = con.execute("SELECT no, sealed FROM shards WHERE name=?", (name,)).fetchone()
+        if row is None:
+            with con:
+                con.execute("INSERT OR IGNORE INTO shards(name, created_at) VALUES(?,?)",
+                            (name, dt.datetime.utcnow().isoformat()))
+            row = con.execute("SELECT no, sealed FROM shards WHERE name=?", (name,)).fetchone()
+        if row[1]: raise RuntimeError(f"shard {name} is sealed")
+        return row[0], self._memory(row[0], name, 0)
+
+    def _con(self):
+        # إحصاءات المدونة (tfidf) من أحدث شظية مفتوحة للكتابة
+        open_ = [s for s in self._rows() if not s[2]]
+        if not open_: return self.route()[1]._con()
+        no, name, _ = open_[-1]
+        return self._memory(no, name, 0)._con()
+
+    def _owner(self, g: int) -> Tuple[Memory, int]:
+        no, local = split(g)
+        row = db.connect(self.catalog).execute("SELECT name, sealed FROM shards WHERE no=?", (no,)).fetchone()
+        if row is None: raise KeyError(f"no shard for id {g}")
+        return self._memory(no, *row), local
+
+    def _fanout(self, fn, shards=None) -> List:
+        shards = self.shards() if shards is None else shards
+        if len(shards) <= 1: return [fn(*s) for s in shards]
+        return list(_POOL.map(lambda s: fn(*s), shards))
+
+    # ---------- الكتابة ----------
+    def doc_exists(self, url: str) -> bool:
+        return any(self._fanout(lambda no, name, m: m.doc_exists(url)))
+
+    def known_urls(self, urls: List[str]) -> set:
+        # المستندات في الشظايا، و fetch_state (ومستندات ما قبل التجزئة) في القاعدة الأساسية
+        known = set().union(*self._fanout(lambda no, name, m: m.known_urls(urls)) or [set()])
+        if os.path.exists(self.db_path): known |= fetch_state.known_urls(db.connect(self.db_path), urls)
+        return known
+
+    def _existing(self, url: str, text: str):
+        """(doc_id عام، distance) لنفس الرابط في أي شظية، وإلا لأقرب شبه مكرر."""
+        ids = [gid(no, i) for no, i in self._fanout(lambda no, name, m: (no, m.doc_id(url))) if i is not None]
+        return (ids[0], 0) if ids else self.find_near_duplicate(text)
+
+    def find_near_duplicate(self, text: str):
+        """(doc_id عام، distance) لأقرب مستند شبه مطابق في أي شظية."""
+        fp = dedup.simhash(text)
+        hits = [(gid(no, h[0]), h[1]) for no, h in
+                self._fanout(lambda no, name, m: (no, dedup.find(m._con(), fp))) if h]
+        return min(hits, key=lambda h: h[1]) if hits else None
+
+    def add_doc(self, url: str, title: str, text: str, source: str, lang: str) -> Tuple[int, bool]:
+        hit = self._existing(url, text)
+        if hit: return hit[0], False
+        no, mem = self.route(source)
+        local, new = mem.add_doc(url, title, text, source, lang)
+        return gid(no, local), new
+
+    def unchunked_text(self, doc_id: int):
+        mem, local = self._owner(doc_id)
+        return mem.unchunked_text(local)
+
+    def add_chunks(self, doc_id: int, chunks: List, embs=None, insights: List[str] = None):
+        mem, local = self._owner(doc_id)
+        mem.add_chunks(local, chunks, embs, insights)
+
+    def add_document_with_chunks(self, url: str, title: str, text: str, source: str, lang: str,
+                                 chunks: List, embs=None, insights: List[str] = None) -> Tuple[int, bool]:
+        # التكرار يُفحص في كل الشظايا، لا في شظية الكتابة وحدها
+        hit = self._existing(url, text)
+        if hit: return hit[0], False
+        no, mem = self.route(source)
+        local, new = mem.add_document_with_chunks(url, title, text, source, lang, chunks, embs, insights)
+        return gid(no, local), new
+
+    def embed_missing(self, batch: int = 64, limit: int = 0) -> int:
+        # الشظايا المختومة مرمّزة بالكامل قبل ختمها
+        done = 0
+        for no, name, m in self.shards():
+            if not m.readonly and (not limit or done < limit):
+                done += m.embed_missing(batch, limit - done if limit else 0)
+        return done
+
+    def counters(self) -> Dict[str, int]:
+        """مجموع عدّادات كل الشظايا (لوحة الإحصاءات)."""
+        total: Dict[str, int] = {}
+        for c in self._fanout(lambda no, name, m: counters.read(m._con())):
+            for k, v in c.items(): total[k] = total.get(k, 0) + v
+        return total
+
+    def files(self) -> List[str]:
+        return glob.glob(os.path.join(self.dir, "*.db")) + glob.glob(os.path.join(self.dir, "*.db-wal"))
+
+    def stats(self) -> Dict:
+        per = self._fanout(lambda no, name, m: (name, m.readonly, counters.read(m._con()), len(m.index),
+                                                os.path.getsize(m.db_path) if os.path.exists(m.db_path) else 0))
+        return {"db_exists": bool(per), "layout": self.layout,
+                "size_mb": round(sum(p[4] for p in per) / 2**20, 3),
+                **{t: sum(p[2].get(t, 0) for p in per) for t in counters.TABLES},
+                "index": sum(p[3] for p in per), "embedder": get_embedder().stats(),
+                "shards": [{"name": n, "sealed": ro, "docs": c.get("docs", 0), "index": i} for n, ro, c, i, _ in per]}
+
+    # ---------- البحث ----------
+    def _timed(self, kind, fn, *args):
+        t0 = time.perf_counter()
+        try: return fn(*args)
+        finally: self.latency.observe(kind, time.perf_counter() - t0)
+
+    def _hits(self, scored: List[Tuple[int, float]]) -> List[Dict]:
+        # نجسّد النصوص من كل شظية للفائزين فيها فقط، ثم نعيد الترتيب العام
+        by: Dict[int, List[Tuple[int, float]]] = {}
+        for g, s in scored: by.setdefault(split(g)[0], []).append((split(g)[1], s))
+        shards = [s for s in self.shards() if s[0] in by]
+        got: Dict[int, Dict] = {}
+        for no, name, hits in self._fanout(lambda no, name, m: (no, name, m._hits(m._con(), by[no])), shards):
+            for h in hits:
+                h.update(chunk_id=gid(no, h["chunk_id"]), doc_id=gid(no, h["doc_id"]), shard=name)
+                got[h["chunk_id"]] = h
+        return [got[g] for g, _ in scored if g in got]
+
+    def _vector(self, qv, k: int) -> List[Tuple[int, float]]:
+        def one(no, name, m):
+            con = m._con(); m._sync(con)
+            return [(gid(no, c), s) for c, s in m._vector_search(con, qv, k)] if len(m.index) else []
+        # جيب التمام قابل للمقارنة بين الشظايا: دمج مباشر بالدرجة
+        return sorted((x for part in self._fanout(one) for x in part), key=lambda x: -x[1])[:k]
+
+    def _lexical(self, query: str, k: int) -> List[Tuple[int, float]]:
+        parts = self._fanout(lambda no, name, m: [(gid(no, c), s) for c, s in fts.search(m._con(), query, k)])
+        return sorted((x for part in parts for x in part), key=lambda x: x[1])[:k]
+
+    def search_chunks(self, query: str, top_k: int = 6) -> List[Dict]:
+        return self._timed("vector", self._search_chunks, query, top_k)
+
+    def _search_chunks(self, query, top_k):
+        return self._hits(self._vector(get_embedder().encode(query)[0], top_k))
+
+    def search_lexical(self, query: str, top_k: int = 6) -> List[Dict]:
+        return self._timed("lexical", self._search_lexical, query, top_k)
+
+    def _search_lexical(self, query, top_k):
+        return self._hits([(g, -s) for g, s in self._lexical(query, top_k)])
+
+    def search_hybrid(self, query: str, top_k: int = 6, candidates: int = 50) -> List[Dict]:
+        return self._timed("hybrid", self._search_hybrid, query, top_k, candidates)
+
+    def _search_hybrid(self, query, top_k, candidates):
+        lexical = [g for g, _ in self._lexical(query, candidates)]
+        vector = [g for g, _ in self._vector(get_embedder().encode(query)[0], candidates)]
+        return self._hits(fts.rrf(lexical, vector)[:top_k])
+
+    # ---------- الختم والاحتفاظ ----------
+    def seal(self, name: str):
+        """شظية لن تُكتب بعد الآن: متجهات كاملة وفهرس متزامن و WAL مفرغ، ثم قراءة فقط."""
+        con = db.connect(self.catalog)
+        row = con.execute("SELECT no, sealed FROM shards WHERE name=?", (name,)).fetchone()
+        if not row or row[1]: return
+        mem = self._memory(row[0], name, 0)
+        mem.embed_missing(); mc = mem._con(); mem.index.sync(mc)
+        mc.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        with con:
+            con.execute("UPDATE shards SET sealed=1 WHERE no=?", (row[0],))
+
+    def drop(self, name: str):
+        """حذف شظية كاملة: صف في الفهرس وبضعة ملفات، بلا DELETE ولا VACUUM."""
+        con = db.connect(self.catalog)
+        row = con.execute("SELECT no FROM shards WHERE name=?", (name,)).fetchone()
+        if not row: return
+        with con:
+            con.execute("DELETE FROM shards WHERE no=?", (row[0],))
+        with self._lock:
+            self._mems.pop(row[0], None)
+        path = self.path(name)
+        db.close_all(path)  # اتصالات كل الخيوط (مجمّع البحث وخيوط الزحف)، لا هذا الخيط وحده
+        for f in glob.glob(glob.escape(path) + "*"):
+            os.remove(f)
+
+    def _kept(self, name: str, p: Dict) -> bool:
+        keep = p["keep_sources"]
+        if not keep: return False
+        return db.connect(self.path(name)).execute(
+            f"SELECT 1 FROM docs WHERE source IN ({','.join('?' * len(keep))}) LIMIT 1", keep).fetchone() is not None
+
+    def _retain(self, no: int, name: str, sealed: int, p: Dict) -> Dict:
+        """دفعة تبريد/حذف داخل شظية (retention.demote/expire)، ثم إعادة بناء فهرسها عند انتهاء تمريرتها.
+        المختومة تُكتب عبر اتصال كتابة منفصل؛ قرّاؤها يرون الفهرس الجديد عند تغيّر الملف."""
+        con = db.connect(self.path(name))
+        out = {"expired": retention.expire(con, p), "demoted": retention.demote(con, p), "reindexed": 0}
+        changed = self._changed[no] = self._changed.get(no, 0) + out["expired"] + out["demoted"]
+        out["pending"] = int(out["expired"] >= p["batch"] or out["demoted"] >= p["batch"])
+        if changed and not out["pending"]:
+            out["reindexed"] = self._memory(no, name, sealed).index.rebuild(con); self._changed[no] = 0
+            if sealed: con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        retention.vacuum_step(con, p["vacuum_pages"])
+        return out
+
+    def maintain(self, p: Dict) -> Dict:
+        """الاحتفاظ داخل كل شظية (retention.policy)؛ وفي تخطيط الأشهر أيضًا ختم الأشهر المنتهية وحذف
+        ملف الشهر الأقدم من delete_after_days كاملًا، إلا إن بقيت فيه مستندات keep_sources."""
+        out = {"sealed": 0, "dropped": 0, "demoted": 0, "expired": 0, "reindexed": 0, "pending": 0}
+        now, current = dt.datetime.utcnow(), _month()
+        for no, name, sealed in self._rows():
+            if self.layout == "month":
+                start = dt.datetime.strptime(name, "%Y-%m")
+                end = (start.replace(day=28) + dt.timedelta(days=4)).replace(day=1)
+                if p.get("delete_after_days") and now - end > dt.timedelta(days=p["delete_after_days"]) \
+                        and not self._kept(name, p):
+                    self.drop(name); out["dropped"] += 1; continue
+                if name < current and not sealed:
+                    self.seal(name); out["sealed"] += 1; sealed = 1
+            for k, v in self._retain(no, name, sealed, p).items(): out[k] += v
+        return out
+
+_instances: Dict[str, ShardedMemory] = {}
+_instances_lock = threading.Lock()
+
+def get_sharded(db_path: str, layout: str = LAYOUT) -> ShardedMemory:
+    with _instances_lock:
+        mem = _instances.get(db_path)
+        if mem is None:
+            mem = _instances[db_path] = ShardedMemory(db_path, layout); mem.init()
+    return mem
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=["list", "seal", "drop"])
+    ap.add_argument("name", nargs="?")
+    ap.add_argument("--db", default=os.getenv("AUTOLEARN_DB", "/data/autolearn.db"))
+    ap.add_argument("--layout", choices=LAYOUTS, default=LAYOUT or "month")
+    args = ap.parse_args()
+    sm = get_sharded(args.db, args.layout)
+    if args.cmd == "seal": sm.seal(args.name)
+    elif args.cmd == "drop": sm.drop(args.name)
+    for s in sm.stats()["shards"]:
+        print(f"{s['name']:12} {'sealed' if s['sealed'] else 'open  '} docs={s['docs']} index={s['index']}")
+
+if __name__ == "__main__":
+    sys.exit(main())
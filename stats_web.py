@@ -1,29 +1,56 @@
 # stats_web.py
-import os, sqlite3
+import os
+import db, answer_cache, counters, tracing, shards
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 
 DB_PATH = os.getenv("AUTOLEARN_DB", "/data/autolearn.db")
 app = FastAPI(title="AutoLearn Dashboard")
+# العدّادات تُقرأ من جدول counters وتُخزّن لثوانٍ، فتحديث الصفحة لا يمسح الجداول.
+# مع AUTOLEARN_SHARDS المستندات في <db>.shards/: نجمع عدّادات الشظايا وأحجامها
+SNAPSHOT = counters.Snapshot(DB_PATH, reader=(lambda: shards.get_sharded(DB_PATH).counters()) if shards.LAYOUT else None)
+
+def _db_bytes():
+    files = [DB_PATH + ext for ext in ("", "-wal")] + (shards.get_sharded(DB_PATH).files() if shards.LAYOUT else [])
+    return sum(os.path.getsize(p) for p in files if os.path.exists(p))
+
+def _latency_con():
+    # زمن البحث المتفرع يُسجَّل في فهرس الشظايا
+    return db.connect(shards.get_sharded(DB_PATH).catalog if shards.LAYOUT else DB_PATH)
 
 def read_stats():
-    stats = {"db_exists": os.path.exists(DB_PATH), "size_mb": 0, "docs": 0, "chunks": 0, "insights": 0}
+    stats = {"db_exists": os.path.exists(DB_PATH), "size_mb": 0, "docs": 0, "chunks": 0, "insights": 0,
+             "sources": {}, "ingest_per_min": 0.0,
+             "answer_cache": {"entries": 0, "hits": 0, "misses": 0, "hit_rate": 0.0}}
     if not stats["db_exists"]:
         return stats
     try:
-        stats["size_mb"] = round(os.path.getsize(DB_PATH) / (1024 * 1024), 2)
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
-        for t in ("docs", "chunks", "insights"):
-            try:
-                stats[t] = cur.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
-            except Exception:
-                stats[t] = 0
-        con.close()
+        stats["size_mb"] = round(_db_bytes() / (1024 * 1024), 2)
+        c = SNAPSHOT.get()
+        if not c:  # قاعدة أقدم من جدول العدّادات: عدّ كامل مرة واحدة
+            counters.ensure(db.connect(DB_PATH)); SNAPSHOT._at = 0; c = SNAPSHOT.get()
+        for t in counters.TABLES:
+            stats[t] = c.get(t, 0)
+        stats["sources"] = {k[7:] or "unknown": v for k, v in c.items() if k.startswith("source:")}
+        stats["ingest_per_min"] = SNAPSHOT.ingest_rate()
+        stats["answer_cache"] = answer_cache.stats(db.connect(DB_PATH))
     except Exception:
         pass
     return stats
 
+def _trace_html():
+    # مراحل آخر دورة زحف مرتبة بالزمن الكلي
+    cycles = tracing.recent(db.connect(DB_PATH), 1) if os.path.exists(DB_PATH) else []
+    if not cycles: return ""
+    c = cycles[0]
+    rows = "".join(f"<tr><td>{r['stage']}</td><td>{r['n']}</td><td>{r['total_ms']:.0f}</td>"
+                   f"<td>{r['p50_ms']:g}</td><td>{r['p95_ms']:g}</td><td>{r['max_ms']:.0f}</td></tr>"
+                   for r in c["stages"])
+    return f"""<h2>آخر دورة ({c['label']}، {c['started_at']}، {c['seconds']} ث)</h2>
+      <table border="1" cellpadding="4" style="border-collapse:collapse">
+        <tr><th>المرحلة</th><th>العدد</th><th>المجموع ms</th><th>p50 ms</th><th>p95 ms</th><th>الأقصى ms</th></tr>
+        {rows}</table>"""
+
 @app.get("/", response_class=HTMLResponse)
 def home():
     s = read_stats()
@@ -37,7 +64,11 @@ def home():
         <li>عدد المستندات: {s['docs']}</li>
         <li>عدد المقاطع: {s['chunks']}</li>
         <li>عدد المعارف: {s['insights']}</li>
+        <li>حسب المصدر: {", ".join(f"{k}: {v}" for k, v in s['sources'].items()) or "-"}</li>
+        <li>معدل الإدخال: {s['ingest_per_min']} مستند/دقيقة</li>
+        <li>ذاكرة الإجابات: {s['answer_cache']['entries']} إجابة — نسبة الإصابة {s['answer_cache']['hit_rate']:.0%}</li>
       </ul>
+      {_trace_html()}
       <script>setTimeout(()=>location.reload(),60000)</script>
     </body></html>
     """
@@ -45,3 +76,39 @@ def home():
 @app.get("/stats.json")
 def stats_json():
     return JSONResponse(read_stats())
+
+@app.get("/trace.json")
+def trace_json(limit: int = 10):
+    return JSONResponse(tracing.recent(db.connect(DB_PATH), limit) if os.path.exists(DB_PATH) else [])
+
+def _metric(lines, name, kind, help_, samples):
+    lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{labels} {value}" for labels, value in samples]
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """صيغة Prometheus النصية."""
+    s = read_stats(); lines = []
+    for t in counters.TABLES:
+        _metric(lines, f"autolearn_{t}", "gauge", f"Rows in {t}.", [("", s[t])])
+    _metric(lines, "autolearn_docs_ingested_total", "counter", "Documents ingested since the counters were created.",
+            [("", SNAPSHOT.get().get("docs_ingested", 0))])
+    _metric(lines, "autolearn_ingest_docs_per_minute", "gauge", "Recent ingest rate.", [("", s["ingest_per_min"])])
+    _metric(lines, "autolearn_source_docs", "gauge", "Documents per source.",
+            [(f'{{source="{k}"}}', v) for k, v in s["sources"].items()])
+    _metric(lines, "autolearn_db_size_bytes", "gauge", "SQLite file size including WAL.",
+            [("", _db_bytes() if s["db_exists"] else 0)])
+    ac = s["answer_cache"]
+    _metric(lines, "autolearn_answer_cache_hits_total", "counter", "Answer cache hits.", [("", ac["hits"])])
+    _metric(lines, "autolearn_answer_cache_misses_total", "counter", "Answer cache misses.", [("", ac["misses"])])
+    hist = counters.latency(_latency_con()) if s["db_exists"] else {}
+    name = "autolearn_search_latency_seconds"
+    lines += [f"# HELP {name} Memory search latency by kind.", f"# TYPE {name} histogram"]
+    for kind, rows in hist.items():
+        acc = 0
+        for le in counters.BUCKETS + (float("inf"),):
+            acc += rows.get(le, 0)
+            lines.append(f'{name}_bucket{{kind="{kind}",le="{"+Inf" if le == float("inf") else le}"}} {acc}')
+        lines.append(f'{name}_sum{{kind="{kind}"}} {rows.get(counters.SUM_US, 0) / 1e6}')
+        lines.append(f'{name}_count{{kind="{kind}"}} {rows.get(counters.COUNT, 0)}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# إحصاءات TF-IDF على مستوى المدونة: جدول تكرار المستندات (df) لكل كلمة يُحدَّث تزايديًا
+# داخل معاملة إدخال كل مستند، فاستخراج أهم الجمل يستعمل IDF المدونة كلها بدل IDF جمل
+# المستند الواحد، ولا يُبنى قاموس جديد في كل استدعاء. الاستخراج دفعي: مصفوفة متفرقة
+# واحدة لجمل عدة مستندات معًا.
+import re, threading, numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List
+from scipy import sparse
+from sklearn.preprocessing import normalize as l2_normalize
+import fts
+
+SENT_RE = re.compile(r"(?<=[.!؟?])\s+")
+# لا نعيد تحميل df إلا إذا كبرت المدونة بهذه النسبة (تغيّر IDF بعدها ضئيل)
+REFRESH_RATIO = 0.05
+
+DDL = (
+    """CREATE TABLE IF NOT EXISTS tfidf_df(term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS tfidf_meta(k TEXT PRIMARY KEY, v INTEGER)""",
+)
+
+def tokens(text: str) -> List[str]:
+    return [w for w in re.findall(r"\w+", fts.normalize((text or "").lower())) if len(w) >= 2]
+
+def record(cur, texts: Iterable[str]) -> int:
+    """أضف مستندات جديدة إلى df وعدد المستندات (ضمن معاملة المستدعي)."""
+    df, n = Counter(), 0
+    for t in texts:
+        df.update(set(tokens(t))); n += 1
+    if not n: return 0
+    cur.executemany("INSERT INTO tfidf_df(term, df) VALUES(?, ?) ON CONFLICT(term) DO UPDATE SET df = df + ?",
+                    [(w, c, c) for w, c in df.items()])
+    cur.execute("INSERT INTO tfidf_meta(k, v) VALUES('n_docs', ?) ON CONFLICT(k) DO UPDATE SET v = v + ?", (n, n))
+    return n
+
+def forget(cur, texts: Iterable[str]) -> int:
+    """عكس record للمستندات المحذوفة (retention.expire)، حتى لا يتضخم df و n_docs."""
+    df, n = Counter(), 0
+    for t in texts:
+        df.update(set(tokens(t))); n += 1
+    if not n: return 0
+    cur.executemany("UPDATE tfidf_df SET df = df - ? WHERE term = ?", [(c, w) for w, c in df.items()])
+    cur.execute("DELETE FROM tfidf_df WHERE df <= 0")
+    cur.execute("UPDATE tfidf_meta SET v = MAX(v - ?, 0) WHERE k = 'n_docs'", (n,))
+    return n
+
+def ensure(con, page: int = 500):
+    fresh = con.execute("SELECT 1 FROM sqlite_master WHERE name='tfidf_df'").fetchone() is None
+    for q in DDL: con.execute(q)
+    if fresh:
+        # بناء df من المستندات الموجودة مرة واحدة
+        last = 0
+        while True:
+            rows = con.execute("SELECT id, text FROM docs WHERE id > ? ORDER BY id LIMIT ?", (last, page)).fetchall()
+            if not rows: break
+            last = rows[-1][0]
+            record(con.cursor(), [t for _, t in rows if t])
+    con.commit()
+
+def n_docs(con) -> int:
+    try:
+        row = con.execute("SELECT v FROM tfidf_meta WHERE k='n_docs'").fetchone()
+    except Exception:
+        return 0
+    return row[0] if row else 0
+
+class Idf:
+    """ذاكرة df داخل العملية: نجلب من القاعدة الكلمات غير المعروفة فقط، ونفرغها
+    عندما تكبر المدونة بأكثر من REFRESH_RATIO."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._df: Dict[str, int] = {}
+        self._n = 0
+
+    def weights(self, con, terms: List[str]) -> np.ndarray:
+        n = n_docs(con)
+        with self._lock:
+            if n > self._n * (1 + REFRESH_RATIO) or n < self._n:
+                self._df.clear(); self._n = n
+            missing = [w for w in terms if w not in self._df]
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                try:
+                    got = dict(con.execute(f"SELECT term, df FROM tfidf_df WHERE term IN ({','.join('?' * len(part))})",
+                                           part).fetchall())
+                except Exception:
+                    got = {}
+                for w in part: self._df[w] = got.get(w, 0)
+            df = np.fromiter((self._df[w] for w in terms), dtype=np.float32, count=len(terms))
+            N = self._n
+        # نفس الصيغة الملساء في sklearn
+        return np.log((1.0 + N) / (1.0 + df)) + 1.0
+
+_IDF = Idf()
+
+def top_sentences(con, texts: List[str], k: int = 3) -> List[List[str]]:
+    """أهم k جمل لكل نص بوزن TF-IDF (IDF المدونة)، لكل النصوص في تحويل واحد."""
+    sents, owner = [], []
+    for i, t in enumerate(texts):
+        for s in dict.fromkeys(SENT_RE.split(t or "")):  # الجمل المكررة تُحسب مرة
+            if s.strip(): sents.append(s); owner.append(i)
+    if not sents: return [[] for _ in texts]
+    vocab: Dict[str, int] = {}; rows, cols = [], []
+    for r, s in enumerate(sents):
+        for w in tokens(s):
+            rows.append(r); cols.append(vocab.setdefault(w, len(vocab)))
+    if not vocab:
+        return [[s for s, o in zip(sents, owner) if o == i][:k] for i in range(len(texts))]
+    X = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(sents), len(vocab)))
+    X = l2_normalize(X @ sparse.diags(_IDF.weights(con, list(vocab))))
+    scores = np.asarray(X.sum(axis=1)).ravel()
+    bounds = np.searchsorted(np.asarray(owner), np.arange(len(texts) + 1))
+    out = []
+    for i in range(len(texts)):
+        a, b = bounds[i], bounds[i + 1]
+        best = a + np.argsort(-scores[a:b], kind="stable")[:k]
+        out.append([sents[j] for j in best])
+    return out
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# قياس زمن المراحل الساخنة (جلب، تحليل، تنظيف، تقطيع، ترميز، تخزين):
+#   with tracing.span("extract.parse"): ...
+# المراحل: fetch.http و fetch.feed و parse.feed و extract.parse و extract.content و dedup
+# و chunk و store و embed و insights، و qa.cache و qa.llm في مسار الأسئلة.
+# كل مرحلة تُجمع في مدرّج (عدد، مجموع، أقصى، دلاء بالملي ثانية) داخل العملية، وتُكتب
+# لكل دورة في trace_cycles/trace_stages. عند AUTOLEARN_TRACE=0 تعيد span() كائنًا
+# فارغًا واحدًا فالكلفة استدعاء دالة فقط. profile() يلتقط cProfile لدورة واحدة.
+import os, json, time, threading, datetime as dt
+from typing import Dict, List
+
+ENABLED = os.getenv("AUTOLEARN_TRACE", "1") != "0"
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+DDL = (
+    """CREATE TABLE IF NOT EXISTS trace_cycles(
+        id INTEGER PRIMARY KEY, label TEXT, started_at TEXT, seconds REAL)""",
+    """CREATE TABLE IF NOT EXISTS trace_stages(
+        cycle_id INTEGER, stage TEXT, n INTEGER, total_ms REAL, max_ms REAL,
+        p50_ms REAL, p95_ms REAL, buckets TEXT, PRIMARY KEY(cycle_id, stage)) WITHOUT ROWID""",
+)
+
+_lock = threading.Lock()
+_stages: Dict[str, list] = {}  # stage -> [n, total_ms, max_ms, buckets...]
+
+def _record(stage: str, ms: float):
+    i = next((j for j, b in enumerate(BUCKETS_MS) if ms <= b), len(BUCKETS_MS))
+    with _lock:
+        s = _stages.get(stage)
+        if s is None: s = _stages[stage] = [0, 0.0, 0.0] + [0] * (len(BUCKETS_MS) + 1)
+        s[0] += 1; s[1] += ms
+        if ms > s[2]: s[2] = ms
+        s[3 + i] += 1
+
+class _Span:
+    __slots__ = ("stage", "t0")
+    def __init__(self, stage): self.stage = stage
+    def __enter__(self): self.t0 = time.perf_counter(); return self
+    def __exit__(self, *exc): _record(self.stage, (time.perf_counter() - self.t0) * 1000.0)
+
+class _Noop:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+
+_NOOP = _Noop()
+
+def span(stage: str):
+    return _Span(stage) if ENABLED else _NOOP
+
+def _quantile(buckets: List[int], n: int, q: float) -> float:
+    # الحد الأعلى للدلو الذي يبلغ فيه التراكم q
+    acc = 0
+    for b, c in zip(BUCKETS_MS + (float("inf"),), buckets):
+        acc += c
+        if acc >= q * n: return b
+    return float("inf")
+
+def take(reset: bool = True) -> Dict[str, Dict]:
+    """ملخص المراحل منذ آخر take(): {stage: {n, total_ms, mean_ms, max_ms, p50_ms, p95_ms, buckets}}."""
+    with _lock:
+        raw = {k: list(v) for k, v in _stages.items()}
+        if reset: _stages.clear()
+    out = {}
+    for stage, (n, total, mx, *bk) in sorted(raw.items()):
+        out[stage] = {"n": n, "total_ms": round(total, 2), "mean_ms": round(total / n, 3) if n else 0.0,
+                      "max_ms": round(mx, 2), "p50_ms": min(_quantile(bk, n, 0.5), mx),
+                      "p95_ms": min(_quantile(bk, n, 0.95), mx), "buckets": bk}
+    return out
+
+def ensure(con):
+    for q in DDL: con.execute(q)
+    con.commit()
+
+def persist(con, label: str, seconds: float, stages: Dict[str, Dict]) -> int:
+    with con:
+        cur = con.cursor()
+        cur.execute("INSERT INTO trace_cycles(label, started_at, seconds) VALUES(?,?,?)",
+                    (label, dt.datetime.utcnow().isoformat(timespec="seconds"), seconds))
+        cid = cur.lastrowid
+        cur.executemany("INSERT INTO trace_stages VALUES(?,?,?,?,?,?,?,?)",
+                        [(cid, k, s["n"], s["total_ms"], s["max_ms"], round(s["p50_ms"], 2),
+                          round(s["p95_ms"], 2), json.dumps(s["buckets"])) for k, s in stages.items()])
+    return cid
+
+def recent(con, limit: int = 1) -> List[Dict]:
+    """آخر الدورات ومراحلها مرتبة بالزمن الكلي (للوحة)."""
+    try:
+        cycles = con.execute("SELECT id, label, started_at, seconds FROM trace_cycles ORDER BY id DESC LIMIT ?",
+                             (limit,)).fetchall()
+    except Exception:
+        return []
+    out = []
+    for cid, label, started, secs in cycles:
+        rows = con.execute("SELECT stage, n, total_ms, max_ms, p50_ms, p95_ms FROM trace_stages "
+                           "WHERE cycle_id=? ORDER BY total_ms DESC", (cid,)).fetchall()
+        out.append({"id": cid, "label": label, "started_at": started, "seconds": secs,
+                    "stages": [dict(zip(("stage", "n", "total_ms", "max_ms", "p50_ms", "p95_ms"), r)) for r in rows]})
+    return out
+
+class profile:
+    """cProfile لكل الخيوط التي تبدأ داخل الكتلة (خيوط مراحل الزحف تُنشأ لكل دورة)."""
+    def __init__(self, path: str):
+        self.path = path; self._profs = []; self._lock = threading.Lock()
+
+    def _thread_hook(self, *args):
+        import cProfile
+        p = cProfile.Profile()
+        with self._lock: self._profs.append(p)
+        p.enable()  # يستبدل هذا الخطّاف في الخيط الحالي
+
+    def __enter__(self):
+        import cProfile
+        self._main = cProfile.Profile()
+        threading.setprofile(self._thread_hook)
+        self._main.enable()
+        return self
+
+    def __exit__(self, *exc):
+        import pstats
+        self._main.disable()
+        threading.setprofile(None)
+        st = pstats.Stats(self._main)
+        with self._lock:
+            for p in self._profs:
+                try: st.add(p)
+                except Exception: pass  # خيط لم يُسجّل شيئًا
+        st.dump_stats(self.path)
+        return False
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# فهرس متجهات دائم على القرص: مصفوفة متصلة (.vec) + خريطة معرّفات المقاطع (.ids)
+# يُفتح عبر mmap ويُلحق به تزايديًا، فلا حاجة لتحميل نصوص المقاطع أثناء البحث.
+# الصيغة float32 أو float16 أو int8 (مع معامل لكل متجه في .scl)؛ التقييم يجري مباشرة
+# على المصفوفة المكممة كتلةً كتلة، ولكل صيغة ملفاتها فتبديلها يبني فهرسًا جديدًا.
+import os, threading, numpy as np
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional, Tuple
+import quant
+from quant import DIM
+
+try:
+    import fcntl
+except ImportError:  # ويندوز: قفل داخل العملية فقط
+    fcntl = None
+
+_NP = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+_TAG = {"float32": "", "float16": ".f16", "int8": ".i8"}
+BLOCK = 65536  # صفوف لكل كتلة تحويل أثناء التقييم
+
+class _Snap(NamedTuple):
+    # حالة mmap ثابتة تُنشر بإسناد واحد: البحث المتزامن مع sync يرى نسخة متسقة كاملة
+    n: int
+    ino: Optional[int]
+    mat: Optional[np.ndarray]
+    ids: Optional[np.ndarray]
+    scl: Optional[np.ndarray]
+    max: int
+
+_EMPTY = _Snap(0, None, None, None, None, 0)
+
+class VectorIndex:
+    def __init__(self, base_path: str, dim: int = DIM, dtype: str = quant.INDEX_DTYPE):
+        self.base_path = base_path
+        base = base_path + _TAG[dtype]
+        self.vec_path = base + ".vec"
+        self.ids_path = base + ".ids"
+        self.scl_path = base + ".scl"
+        self.lock_path = base_path + ".lock"
+        self.dim, self.dtype = dim, dtype
+        self._np = _NP[dtype]
+        self._row = dim * np.dtype(self._np).itemsize
+        self._lock = threading.Lock()
+        self._snap = _EMPTY
+
+    def __len__(self) -> int:
+        return self._count()
+
+    def _files(self):
+        fs = [(self.vec_path, self._row), (self.ids_path, 8)]
+        if self.dtype == "int8": fs.append((self.scl_path, 4))
+        return fs
+
+    def _count(self) -> int:
+        try:
+            return min(os.path.getsize(p) // w for p, w in self._files())
+        except OSError:
+            return 0
+
+    @contextmanager
+    def _writer(self):
+        # قفل ملف حتى لا يُلحق العامل ولوحة الويب الصفوف نفسها مرتين
+        with self._lock:
+            fp = open(self.lock_path, "a")
+            try:
+                if fcntl: fcntl.flock(fp, fcntl.LOCK_EX)
+                yield
+            finally:
+                if fcntl: fcntl.flock(fp, fcntl.LOCK_UN)
+                fp.close()
+
+    def _open(self) -> _Snap:
+        # أعد فتح الـmmap فقط إذا تغيّر الملف (إلحاق، أو استبدال بعد rebuild من عملية أخرى)
+        prev = self._snap
+        n = self._count()
+        try: ino = os.stat(self.vec_path).st_ino
+        except OSError: ino = None
+        if n == prev.n and ino == prev.ino and (prev.mat is not None or n == 0): return prev
+        if n == 0:
+            snap = _EMPTY._replace(ino=ino)
+        else:
+            old = prev.n if ino == prev.ino and n > prev.n else 0
+            mat = np.memmap(self.vec_path, dtype=self._np, mode="r", shape=(n, self.dim))
+            ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(n,))
+            scl = np.memmap(self.scl_path, dtype=np.float32, mode="r", shape=(n,)) if self.dtype == "int8" else None
+            # المعرّفات ليست مرتبة بعد fill: أكبرها يُحدَّث بالصفوف الملحقة فقط
+            snap = _Snap(n, ino, mat, ids, scl, max(prev.max if old else 0, int(ids[old:].max())))
+        self._snap = snap
+        return snap
+
+    def last_id(self) -> int:
+        return self._open().max
+
+    def _append(self, ids: np.ndarray, vecs: np.ndarray):
+        n = self._count()
+        # قص أي كتابة مبتورة سابقة حتى تبقى الملفات متطابقة
+        for p, w in self._files():
+            if os.path.exists(p) and os.path.getsize(p) != n * w:
+                os.truncate(p, n * w)
+        if self.dtype == "int8":
+            q, s = quant.quantize_int8(vecs)
+            parts = [(self.vec_path, q), (self.scl_path, s)]
+        else:
+            parts = [(self.vec_path, vecs.astype(self._np))]
+        parts.append((self.ids_path, np.asarray(ids, dtype=np.int64)))
+        for p, arr in parts:
+            with open(p, "ab") as f: f.write(np.ascontiguousarray(arr).tobytes())
+
+    def _rows(self, rows) -> int:
+        rows = [r for r in rows if quant.blob_dtype(r[1], self.dim)]
+        if not rows: return 0
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        self._append(ids, quant.decode_many([r[1] for r in rows], self.dim))
+        return len(rows)
+
+    def sync(self, con, page: int = 4096) -> int:
+        """ألحق بالفهرس كل صفوف chunks ذات المتجه والتي لم تُفهرس بعد."""
+        with self._writer():
+            return self._sync(con, page)
+
+    def _sync(self, con, page: int = 4096) -> int:
+        added = 0
+        cur = con.execute("SELECT id, emb FROM chunks WHERE id > ? AND emb IS NOT NULL ORDER BY id",
+                          (self.last_id(),))
+        while True:
+            batch = cur.fetchmany(page)
+            if not batch: break
+            added += self._rows(batch)
+        return added
+
+    def fill(self, con, ids: List[int]) -> int:
+        """متجهات حُسبت لاحقًا (embed_missing) لمقاطع تحت آخر معرّف مفهرس: sync وحده لا يراها.
+        ما فوقه يُترك لـ sync حتى يبقى الحد الأعلى رتيبًا."""
+        added = 0
+        with self._writer():
+            added += self._sync(con)
+            snap = self._open()
+            low = [i for i in ids if i <= snap.max]
+            if low and snap.n:  # rebuild متزامن ربما أدخلها بالفعل
+                low = [int(i) for i in np.asarray(low, dtype=np.int64)[~np.isin(low, snap.ids)]]
+            for i in range(0, len(low), 500):
+                part = low[i:i + 500]
+                added += self._rows(con.execute(f"SELECT id, emb FROM chunks WHERE id IN ({','.join('?' * len(part))}) "
+                                                f"AND emb IS NOT NULL ORDER BY id", part).fetchall())
+        return added
+
+    def rebuild(self, con) -> int:
+        """يبني الفهرس في ملفات جانبية ثم يستبدلها ذريًا: القرّاء في عمليات أخرى يبقون على
+        mmap النسخة القديمة (لا قص تحت أقدامهم) حتى يلاحظوا الملف الجديد."""
+        tmp = VectorIndex(self.base_path + ".new", self.dim, self.dtype)
+        with self._writer():
+            for p, _ in tmp._files():
+                if os.path.exists(p): os.remove(p)
+            added = tmp._sync(con)
+            for (src, _), (dst, _) in zip(tmp._files(), self._files()):
+                if os.path.exists(src): os.replace(src, dst)
+                elif os.path.exists(dst): os.remove(dst)
+            if os.path.exists(tmp.lock_path): os.remove(tmp.lock_path)
+            self._snap = _EMPTY
+        return added
+
+    def _scores(self, snap: _Snap, qv: np.ndarray) -> np.ndarray:
+        if self.dtype == "float32":
+            return snap.mat @ qv
+        # float16/int8: نحوّل كتلة صغيرة كل مرة بدل نسخ المصفوفة كاملة إلى float32
+        S = np.empty(snap.n, dtype=np.float32)
+        for i in range(0, snap.n, BLOCK):
+            S[i:i + BLOCK] = snap.mat[i:i + BLOCK].astype(np.float32) @ qv
+        if self.dtype == "int8":
+            S *= snap.scl
+        return S
+
+    def search(self, qv: np.ndarray, top_k: int = 6) -> List[Tuple[int, float]]:
+        # المتجهات مُطبّعة، فالضرب النقطي = تشابه جيب التمام
+        snap = self._open()  # لقطة محلية واحدة طوال البحث
+        if not snap.n or top_k <= 0: return []
+        S = self._scores(snap, np.asarray(qv, dtype=np.float32).ravel())
+        k = min(top_k, snap.n)
+        part = np.argpartition(-S, k - 1)[:k]
+        order = part[np.argsort(-S[part])]
+        return [(int(snap.ids[i]), float(S[i])) for i in order]